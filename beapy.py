@@ -1,40 +1,371 @@
+import codecs
+import collections
+import collections.abc
+import concurrent.futures
+import contextlib
+import contextvars
+import csv
 import datetime
-import requests
-import numpy as np
-import pandas as pd
+import difflib
+import email.utils
+import functools
+import hashlib
+import http.client
+import importlib
+import io
+import json
+import os
+import re
+import urllib.parse
+import sqlite3
+import threading
+import time
+import zlib
 import sys
 
 
+class LazyModule:
+
+    '''Stand-in for a module that is imported the first time one of its attributes is used, so that importing beapy
+    does not load requests, numpy or pandas until they are needed.'''
+
+    def __init__(self,name):
+
+        self.__dict__['_name'] = name
+        self.__dict__['_module'] = None
+
+    def __getattr__(self,key):
+
+        module = self.__dict__['_module']
+        if module is None:
+            module = importlib.import_module(self.__dict__['_name'])
+            self.__dict__['_module'] = module
+        return getattr(module,key)
+
+    def __repr__(self):
+
+        return '<lazy module '+repr(self.__dict__['_name'])+'>'
+
+
+def optionalImport(name):
+
+    '''Function importing an optional dependency (e.g. aiohttp, pyarrow.parquet) when it is first needed. Returns
+    None if it is not installed.'''
+
+    try:
+        return importlib.import_module(name)
+    except ImportError:
+        return None
+
+
+asyncio = LazyModule('asyncio')
+requests = LazyModule('requests')
+np = LazyModule('numpy')
+pd = LazyModule('pandas')
+pyarrow = LazyModule('pyarrow')
+
+
+apiUrl = 'http://bea.gov/api/data/'
+
+# Parameters whose values are checked against the accepted values listed in the catalog (see Catalog.validate)
+codeParameters = ['tableid','tablename','keycode','indicator','areaorcountry','typeofinvestment','component','industry']
+
+# Older parameter names still accepted by the API, with the names used in its metadata
+parameterAliases = {'tableid':'tablename'}
+
+# Splitting of large requests (see initialize._planRequests): datasets and geography levels split by year, chunk
+# sizes, and the most chunks of one request sent at once
+regionalDatasets = ['regionaldata','regionalincome','regionalproduct']
+largeGeographies = ['COUNTY','MSA','MIC','PORT','DIV','CSA']
+chunkYears = 10
+chunkGeographies = 250
+chunkWorkers = 4
+
+# Markers sent in place of a DataValue when a value is suppressed or unavailable, e.g. (D): not shown to avoid
+# disclosure of confidential information, (NA): not available, (NM): not meaningful, (L): less than the smallest
+# unit shown. Any other non-numeric DataValue is treated the same way (see convertValues).
+suppressionCodes = ['(D)','(NA)','(NM)','(L)','(S)','(X)','(T)','(P)','(E)','(*)','(C)','(B)','(H)','(N)','---','n.a.']
+
+# HTTP status codes on which requests are retried
+retryStatuses = [429,500,502,503,504]
+
+# Error descriptions of the BEA API saying that a request asks for more data than one response may hold, e.g. "The
+# request exceeds the maximum data size". Throttling errors ("too many requests", "rate limit exceeded") must not
+# match: split requests are only sent for these (see isSizeError).
+sizeErrorPattern = re.compile(r'exceed(s|ed)?\b.*\b(size|rows|cells|records|data)\b|\btoo (large|much data)\b',re.IGNORECASE)
+
+
 # August 3, 2015: Updated the getNipa() method to accomodate possible differences in data availability for series in tables. 
 #                 Cleaned up and organized the code substantially.
 
 class initialize:
 
-    def __init__(self,apiKey=None):
-        ''' Saves the API key.'''
+    def __init__(self,apiKey=None,cache=None,poolSize=10,timeout=(10,120),retries=5,backoff=0.5,rateLimit=100,streaming=False,catalogPath=None,validate='cached',splitRequests=True,observers=None,frameCache=None,baseUrl=None,raiseErrors=False):
+        ''' Saves the API key and opens a pooled HTTP session that is used for every request.
+
+        cache       optional response cache (e.g. a ResponseCache instance) with get(params,compressed=False) and
+                    put(params,body,compressed=False) methods. Raw API responses are served from and saved to it.
+        poolSize    number of keep-alive connections kept open to the API host.
+        timeout     seconds to wait for a connection and for the response, as a (connect, read) tuple or one number.
+        retries     number of times a request is retried after a connection error, a 5xx response, a 429
+                    (throttled) response or a response cut off before its end.
+        backoff     base of the exponential wait between retries, in seconds. A Retry-After header sent by the
+                    server takes precedence.
+        rateLimit   most requests sent to the API per minute for this API key, shared by every instance using the
+                    key. When instances ask for different limits the lowest applies to all of them. None for no
+                    limit on this instance.
+        streaming   if True, responses are decoded incrementally as they arrive and the data records are kept column
+                    by column (see streamJson()), so the whole document is never held as Python objects. Use for
+                    very large RegionalIncome and RegionalData requests.
+        catalogPath JSON file in which the catalog of datasets, parameters and parameter values is kept between
+                    sessions (see Catalog). Default: ~/.beapy/catalog.json for the BEA API, and no file when baseUrl
+                    is given, since other servers may list other values. False keeps the catalog in memory only.
+        validate    how data requests are checked before they are sent (see Catalog.validate). 'cached': against
+                    the lists already in the catalog, with no extra requests; True: also request missing lists
+                    (once); False: no checks. Invalid requests raise ValidationError without reaching the network.
+        splitRequests  if True, queries too large for one response are sent in parallel chunks of years or
+                    geographies and merged into the frame a single request would give (see _planRequests).
+        observers   optional list of callables, each called with a dict of metrics after every data method call (see
+                    CallMetrics), e.g. a MetricsAggregator. More can be added later with addObserver().
+        frameCache  optional in-memory cache of parsed results (a FrameCache), so that repeated calls with the same
+                    arguments skip the request, decoding and pivoting altogether.
+        baseUrl     URL requests are sent to instead of apiUrl (the BEA API), e.g. that of a local StubServer (see
+                    stubserver.py) for offline or load testing. Responses are cached without regard to the URL, so
+                    give each URL its own cache.
+        raiseErrors if True, the data methods raise BeaError (ValidationError for invalid requests) on failure
+                    instead of printing the error and returning None. fetch() always raises.
+        '''
 
         self.apiKey = apiKey
+        self.baseUrl = baseUrl
+        self.cache = cache
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.streaming = streaming
+        self.validate = validate
+        self.splitRequests = splitRequests
+        self.poolSize = poolSize
+        self.observers = list(observers or [])
+        self.contentHashes = {}
+        self.frameCache = frameCache
+        self.raiseErrors = raiseErrors
+        self.rateLimiter = None
+        if rateLimit is not None:
+            self.rateLimiter = getRateLimiter(apiKey,rateLimit)
+
+        self._session = None
+        self._sessionLock = threading.Lock()
+
+        if catalogPath is None and baseUrl is None:
+            catalogPath = os.path.join(os.path.expanduser('~'),'.beapy','catalog.json')
+        self.catalog = Catalog(self,catalogPath or None)
+
+    @property
+    def session(self):
+
+        '''The pooled requests session used for every request, opened on first use so that requests is only
+        imported when a request is sent.'''
+
+        if self._session is None:
+            with self._sessionLock:
+                if self._session is None:
+                    retry = requests.adapters.Retry(total=self.retries,backoff_factor=self.backoff,status_forcelist=retryStatuses,allowed_methods=['GET'],respect_retry_after_header=True,raise_on_status=False)
+                    adapter = requests.adapters.HTTPAdapter(pool_connections=self.poolSize,pool_maxsize=self.poolSize,max_retries=retry)
+                    session = requests.Session()
+                    session.mount('http://',adapter)
+                    session.mount('https://',adapter)
+                    self._session = session
+        return self._session
+
+    # 0. Requests to the BEA API
+
+    @property
+    def url(self):
+
+        '''The URL requests are sent to: baseUrl if given, else apiUrl.'''
+
+        return self.baseUrl or apiUrl
+
+    def _getJson(self,params):
+
+        '''Returns the decoded JSON response for a request to the BEA API. params is a dict of the request parameters
+        other than UserID. Successful responses are saved to the cache, if there is one. Raises BeaError if the
+        response has an HTTP error status once retries are exhausted (e.g. 429 when throttled).'''
+
+        if self.streaming:
+            return self._streamJson(params)
+
+        body, status, cached, validators = self._getBody(params)
+        if status!=200:
+            raise BeaError(statusMessage(status,body))
+        rJson = decodeJson(body)
+
+        if not cached and not isError(rJson):
+            self._saveBody(params,body,validators)
+
+        return rJson
+
+    def _getBody(self,params,revalidate=False):
+
+        '''Returns the raw body of the response to a request as (body, HTTP status, True if served from the cache,
+        validators), where validators holds the ETag and Last-Modified headers of the response. If the cache holds
+        an expired response with validators, the request is made conditional, and a 304 (Not Modified) answer
+        renews the cached response. If revalidate is True, even a fresh cached response is checked with the server.
+        Unlike _getJson(), does not save the response to the cache, since it is not decoded here. The content hash
+        of the body is kept in contentHashes.'''
+
+        previous = None
+        if self.cache is not None:
+            body = None if revalidate else self.cache.get(params)
+            if body is not None:
+                recordMetrics(cacheHits=1)
+                self.contentHashes[requestKey(params)] = contentHash(body)
+                return body, 200, True, {}
+            recordMetrics(cacheMisses=1)
+            if hasattr(self.cache,'validators'):
+                previous = self.cache.validators(params)
+
+        if self.rateLimiter is not None:
+            self.rateLimiter.wait()
+
+        start = time.perf_counter()
+        r = self._retryTruncated(lambda: self.session.get(self.url,params=dict(UserID=self.apiKey,**params),headers=conditionalHeaders(previous),timeout=self.timeout))
+        recordResponse(r,start)
+        if r.status_code==304 and previous is not None:
+            body = self.cache.revalidate(params)
+            if body is not None:
+                recordMetrics(notModified=1)
+                self.contentHashes[requestKey(params)] = contentHash(body)
+                return body, 200, True, previous
+            # The cached response was evicted meanwhile
+            start = time.perf_counter()
+            r = self._retryTruncated(lambda: self.session.get(self.url,params=dict(UserID=self.apiKey,**params),timeout=self.timeout))
+            recordResponse(r,start)
+
+        self.contentHashes[requestKey(params)] = contentHash(r.content)
+        validators = {'etag':r.headers.get('ETag'),'lastModified':r.headers.get('Last-Modified')}
+        return r.content, r.status_code, False, {key:value for key,value in validators.items() if value is not None}
+
+    def _retryTruncated(self,send):
+
+        '''Returns send(), the response of a request, calling it again up to retries times, with exponential backoff, if
+        the body is cut off before its end. Raises BeaError once retries are exhausted.'''
+
+        for attempt in range(self.retries+1):
+            try:
+                return send()
+            except (requests.exceptions.ChunkedEncodingError,http.client.IncompleteRead) as e:
+                if attempt==self.retries:
+                    raise BeaError('The response was cut off before its end: '+str(e)) from e
+            recordMetrics(retries=1)
+            time.sleep(self.backoff*2**attempt)
+
+    def _saveBody(self,params,body,validators=None):
+
+        '''Saves a successful response to the cache, if there is one, with its validators if the cache keeps them.'''
+
+        if self.cache is None:
+            return
+        if validators and hasattr(self.cache,'validators'):
+            self.cache.put(params,body,**validators)
+        else:
+            self.cache.put(params,body)
+
+    # Revisions: content hashes of the responses received are kept in contentHashes, keyed by requestKey(), so that
+    # changed() can tell whether a table was revised without comparing frames. diff() then finds the revised cells.
+
+    def changed(self,method,*args,**kwargs):
+
+        '''Returns True if the response to a data method call (e.g. changed('getNipa','T10101','Q')) differs from the
+        last one this client received, or that the cache holds, False if it is the same, and None if there is no
+        previous response to compare. The request is sent even if the cache holds a fresh response, conditionally
+        where the server supports it, and a changed response replaces the cached one.'''
+
+        params, parse = getattr(self,'_'+method+'Request')(*args,**kwargs)
+        results = []
+        for chunk in self._planRequests(params):
+            key = requestKey(chunk)
+            previous = self.contentHashes.get(key)
+            if previous is None and hasattr(self.cache,'contentHash'):
+                previous = self.cache.contentHash(chunk)
+            body, status, cached, validators = self._getBody(chunk,revalidate=True)
+            if not cached and status==200 and not isError(decodeJson(body)):
+                self._saveBody(chunk,body,validators)
+            results.append(None if previous is None else previous!=self.contentHashes[key])
+        if any(result is True for result in results):
+            return True
+        if any(result is None for result in results):
+            return None
+        return False
+
+    def _streamJson(self,params):
+
+        '''Streaming version of _getJson(). The response is decoded chunk by chunk with streamJson(). Responses are
+        compressed as they arrive before being saved to the cache. Since decoding overlaps the download, its time is
+        counted in httpSeconds of the call metrics.'''
+
+        if self.cache is not None:
+            body = self.cache.get(params,compressed=True)
+            if body is not None:
+                recordMetrics(cacheHits=1)
+                return decodeJson(inflate(body),streamJson)
+            recordMetrics(cacheMisses=1)
+
+        if self.rateLimiter is not None:
+            self.rateLimiter.wait()
+
+        def receive():
+            start = time.perf_counter()
+            with self.session.get(self.url,params=dict(UserID=self.apiKey,**params),timeout=self.timeout,stream=True) as r:
+                if r.status_code!=200:
+                    recordResponse(r,start)
+                    raise BeaError(statusMessage(r.status_code,r.content))
+                if self.cache is None:
+                    rJson = decodeJson(r.iter_content(chunk_size=65536),streamJson)
+                    recordResponse(r,start,streamed=True)
+                    return rJson
+
+                compressor = zlib.compressobj()
+                compressed = []
+
+                def chunks():
+                    for chunk in r.iter_content(chunk_size=65536):
+                        compressed.append(compressor.compress(chunk))
+                        yield chunk
+
+                rJson = decodeJson(chunks(),streamJson)
+                compressed.append(compressor.flush())
+                recordResponse(r,start,streamed=True)
+
+                if not isError(rJson):
+                    self.cache.put(params,b''.join(compressed),compressed=True)
+
+            return rJson
+
+        # A cut off response is sent again from the start
+        return self._retryTruncated(receive)
 
     # 1. Methods for getting information about the available datasets, parameters, and parameter values.
 
+    # The lists behind these methods come from self.catalog (see Catalog), which requests each of them from the API
+    # only once.
+
     def getDataSetList(self):
 
         '''Method returns a list of describing the datasets available through the BEA API. No arguments'''
 
-        r = requests.get('http://www.bea.gov/api/data?&UserID='+self.apiKey+'&method=GETDATASETLIST&ResultFormat=JSON&')
-        rJson = r.json()
-        lines='Datasets available through the BEA API:\n\n'
-        n=1
-
+        lines = ['Datasets available through the BEA API:\n\n']
         dataSetList = []
-        for element in rJson['BEAAPI']['Results']['Dataset']:
-            if np.mod(n,5)==0:
-                lines = lines+str(n).ljust(4,' ')+element['DatasetName'].ljust(20,' ') +': '+element['DatasetDescription']+'\n\n'
-                dataSetList.append(element['DatasetName'])
+        for n,element in enumerate(self.catalog.datasetRecords(),1):
+            lines.append(str(n).ljust(4,' ')+element['DatasetName'].ljust(20,' ') +': '+element['DatasetDescription'])
+            if n%5==0:
+                lines.append('\n\n')
             else:
-                lines = lines+str(n).ljust(4,' ')+element['DatasetName'].ljust(20,' ') +': '+element['DatasetDescription']+'\n'
-                dataSetList.append(element['DatasetName'])
-            n+=1
+                lines.append('\n')
+            dataSetList.append(element['DatasetName'])
+
+        lines = ''.join(lines)
         print(lines)
         self.dataSets = lines
         self.dataSetList = dataSetList
@@ -43,67 +374,48 @@ class initialize:
 
         '''Method returns a list of the parameters for a given dataset. Argument: one of the dataset names returned by getDataSetList().'''
 
-        r = requests.get('http://www.bea.gov/api/data?&UserID='+self.apiKey+'&method=GETPARAMETERLIST&datasetname='+dataSetName+'&ResultFormat=JSON&')
-        rJson = r.json()
-        lines = 'Parameters for the '+dataSetName+' dataset.\n\n'
+        lines = ['Parameters for the '+dataSetName+' dataset.\n\n']
 
         strWidth  = 25
         descrWidth = 50
         parameterList = []
 
-        def splitString(origString, maxLength):
-            splitLines = []
-            line = ''
-            for word in origString.split(' '):
-                if len(line)+1+len(word)<maxLength:
-                    line = line+word+' '
-                else:
-                    splitLines.append(line)
-                    line = word+' '
-            if len(line) != 0:
-                splitLines.append(line)
-
-            return splitLines
-
-
-        for element in rJson['BEAAPI']['Results']['Parameter']:
+        for element in self.catalog.parameterRecords(dataSetName):
 
-            elementKeys = list(element.keys())
+            lines.append('Parameter name'.ljust(strWidth,' ')  +'  '+element['ParameterName']+'\n')
 
-            lines = lines+'Parameter name'.ljust(strWidth,' ')  +'  '+element['ParameterName']+'\n'
-
-            split = splitString(element['ParameterDescription'],descrWidth)
-            for n,line in enumerate(split):
+            for n,line in enumerate(splitString(element['ParameterDescription'],descrWidth)):
                 if n ==0:
-                    lines = lines+'Description'.ljust(strWidth,' ')  + '  '+line+'\n'
+                    lines.append('Description'.ljust(strWidth,' ')  + '  '+line+'\n')
                 else:
-                    lines = lines+'  '.ljust(strWidth,' ')  + '  '+line+'\n'
+                    lines.append('  '.ljust(strWidth,' ')  + '  '+line+'\n')
 
             parameterList.append(element['ParameterName'])
 
             if element['ParameterIsRequiredFlag']==0:
-                lines = lines+'Required?'.ljust(strWidth,' ')  + '  No'+'\n'
+                lines.append('Required?'.ljust(strWidth,' ')  + '  No'+'\n')
             else:
-                lines = lines+'Required?'.ljust(strWidth,' ')  + '  Yes'+'\n'
-            
-            if 'AllValue' in elementKeys:
+                lines.append('Required?'.ljust(strWidth,' ')  + '  Yes'+'\n')
+
+            if 'AllValue' in element:
                 if element['AllValue']=='':
-                    lines = lines+'\"All\" Value'.ljust(strWidth,' ')  + '  N/A'+'\n'
+                    lines.append('\"All\" Value'.ljust(strWidth,' ')  + '  N/A'+'\n')
                 else:
-                    lines = lines+'\"All\" Value'.ljust(strWidth,' ') +'  '+element['AllValue']+'\n'
+                    lines.append('\"All\" Value'.ljust(strWidth,' ') +'  '+element['AllValue']+'\n')
             # if element['MultipleAcceptedFlag']==0:
             #     lines = lines+'Multiple (list) accepted?'.ljust(strWidth,' ')  + '  No'+'\n'
             # else:
             #     lines = lines+'Multiple (list) accepted?'.ljust(strWidth,' ')  + '  Yes'+'\n'
-            lines = lines+'Data type'.ljust(strWidth,' ')  + '  '+element['ParameterDataType']+'\n'
-            if 'ParameterDefaultValue' in elementKeys:
+            lines.append('Data type'.ljust(strWidth,' ')  + '  '+element['ParameterDataType']+'\n')
+            if 'ParameterDefaultValue' in element:
                 if element['ParameterDefaultValue']=='':
-                    lines = lines+'Default value'.ljust(strWidth,' ')  + '  N/A'+'\n\n\n'
+                    lines.append('Default value'.ljust(strWidth,' ')  + '  N/A'+'\n\n\n')
                 else:
-                    lines = lines+'Default value'.ljust(strWidth,' ')  + '  '+element['ParameterDefaultValue']+'\n\n\n'
+                    lines.append('Default value'.ljust(strWidth,' ')  + '  '+element['ParameterDefaultValue']+'\n\n\n')
             else:
-                lines = lines+'\n\n'
+                lines.append('\n\n')
 
+        lines = ''.join(lines)
         print(lines)
         self.parameters = lines
         self.parameterList = parameterList
@@ -113,199 +425,301 @@ class initialize:
         '''Method returns a list of the  values accepted for a given parameter of a dataset.
         Arguments: one of the dataset names returned by getDataSetList() and a parameter returned by getParameterList().'''
 
-        r = requests.get('http://bea.gov/api/data?&UserID='+self.apiKey+'&method=GetParameterValues&datasetname='+dataSetName+'&ParameterName='+parameterName+'&')
-        rJson = r.json()
+        records = self.catalog.valueRecords(dataSetName,parameterName)
 
+        lines = ['Values accepted for '+parameterName+' in dataset '+dataSetName+':\n\n']
 
-        lines='Values accepted for '+parameterName+' in dataset '+dataSetName+':\n\n'
+        if dataSetName.lower() == 'nipa' and parameterName.lower() == 'showmillions' and len(records)==0:
 
-        if dataSetName.lower() == 'nipa' and parameterName.lower() == 'showmillions' and 'ParamValue' not in rJson['BEAAPI']['Results'].keys():
-
-            lines+= 'ShowMillions'.ljust(20,' ')+': N\n'
-            lines+= 'Description'.ljust(20,' ')+': Units in billions of USD (default)\n\n'
-            lines+= 'ShowMillions'.ljust(20,' ')+': Y\n'
-            lines+= 'Description'.ljust(20,' ')+': Units in millions of USD\n\n'
+            lines.append('ShowMillions'.ljust(20,' ')+': N\n')
+            lines.append('Description'.ljust(20,' ')+': Units in billions of USD (default)\n\n')
+            lines.append('ShowMillions'.ljust(20,' ')+': Y\n')
+            lines.append('Description'.ljust(20,' ')+': Units in millions of USD\n\n')
 
         else:
 
             descrWidth = 50
-            def splitString(origString, maxLength):
-                splitLines = []
-                line = ''
-                for word in origString.split(' '):
-                    if len(line)+1+len(word)<maxLength:
-                        line = line+word+' '
-                    else:
-                        splitLines.append(line)
-                        line = word+' '
-                if len(line) != 0:
-                    splitLines.append(line)
-
-                return splitLines
 
             columnNames = []
-            for n,element in enumerate(rJson['BEAAPI']['Results']['ParamValue']):
+            for element in records:
                 for key in element.keys():
                     if key not in columnNames:
                         columnNames.append(key)
-            
-            data = np.zeros([n,len(columnNames)])
-            data[:] = np.nan
-            tempFrame = pd.DataFrame(data,columns = columnNames)
-
-            for n,element in enumerate(rJson['BEAAPI']['Results']['ParamValue']):
-                for key,value in element.items():
-                    tempFrame.loc[n,key] = element[key]
 
-            # Sort tempFrame if the parameter falls into one of a few special categories
-            if dataSetName.lower() == 'nipa':
-                if parameterName.lower() =='tableid':
-                    tempFrame.sort(columns = ['TableID'])
-                elif parameterName.lower() =='year':
-                    tempFrame = tempFrame[['TableID','FirstAnnualYear','LastAnnualYear','FirstQuarterlyYear','LastQuarterlyYear','FirstMonthlyYear','LastMonthlyYear']]
-                    tempFrame.sort(columns = ['TableID'])
-
-            elif dataSetName.lower() == 'fixedassets':
-                if parameterName.lower() =='tableid':
-                    tempFrame.sort(columns = ['TableID'])
-                elif parameterName.lower() =='year':
-                    tempFrame = tempFrame[['TableID','FirstAnnualYear','LastAnnualYear']]
-                    tempFrame.sort(columns = ['TableID'])
+            # Order the values if the parameter falls into one of a few special categories
+            sortKey = None
+            if dataSetName.lower() in ['nipa','fixedassets']:
+                if parameterName.lower() in ['tableid','year']:
+                    sortKey = columnNames[0]
+                if parameterName.lower() =='year':
+                    yearColumns = ['FirstAnnualYear','LastAnnualYear','FirstQuarterlyYear','LastQuarterlyYear','FirstMonthlyYear','LastMonthlyYear']
+                    columnNames = columnNames[:1]+[c for c in yearColumns if c in columnNames]
 
             elif dataSetName.lower() == 'gdpbyindustry':
                 if parameterName.lower() =='tableid':
-                    tempFrame.sort(columns = ['Key'])
+                    sortKey = 'Key'
+
+            if sortKey is not None:
+                records = sorted(records,key=lambda element:str(element.get(sortKey,'')))
 
-            for i in tempFrame.index:
-                for c in tempFrame.columns:
-                    split = splitString(tempFrame.loc[i,c],descrWidth)
-                    for n, words in enumerate(split):
+            for element in records:
+                for c in columnNames:
+                    if c not in element:
+                        continue
+                    for n, words in enumerate(splitString(str(element[c]),descrWidth)):
                         if n==0:
                             try:
-                                lines+=c.ljust(20,' ')+': '+str(int(words))+'\n'
-                            except:
-                                lines+=c.ljust(20,' ')+': '+str(words)+'\n'
+                                lines.append(c.ljust(20,' ')+': '+str(int(words))+'\n')
+                            except ValueError:
+                                lines.append(c.ljust(20,' ')+': '+str(words)+'\n')
                         else:
-                            try:
-                                lines+=''.ljust(20,' ')+'  '+str(words)+'\n'
-                            except:
-                                lines+=''.ljust(20,' ')+'  '+str(words)+'\n'
-                lines+='\n'
-        
+                            lines.append(''.ljust(20,' ')+'  '+str(words)+'\n')
+                lines.append('\n')
+
+        lines = ''.join(lines)
         print(lines)
         self.parameterValues = lines
 
     # 2. Methods for retreiving data.
 
-    # 2.1 Regional Data (statistics by state, county, and MSA)
+    # Each get* data method has a matching _get*Request method that returns the request parameters and a function
+    # that parses the decoded response. _fetchData() runs the two and raises BeaError on failure; _getData() prints
+    # the error and returns None instead, which is the behavior of the public methods.
+    #
+    # Every data method also takes two output options (see buildFrame):
+    #
+    #   output      'wide' (default): one column per series; 'sparse': the same with a sparse dtype; 'long': one row
+    #               per observation with categorical label columns (e.g. GeoFips, GeoName) and a 'value' column.
+    #               longToWide() converts a long frame back to the wide layout.
+    #   dtype       dtype of the values, e.g. 'float32'. Default 'float64'.
+    #   codes       if True, also return the suppression codes (e.g. '(D)', '(NA)') sent in place of values, which
+    #               are NaN in the data: as a 'codes' frame of the same shape in the wide layouts, or as a 'code'
+    #               column in the long layout.
+    #   seriesKey   'description' (default): series are named by their descriptions (LineDescription, GeoName,
+    #               ...); 'code': by their codes (SeriesCode, GeoFips, Industry, TimeSeriesId), which are unique
+    #               where descriptions may repeat (e.g. several 'Goods' lines in a NIPA table). The result then
+    #               also holds a 'series' table of the description, units and multiplier of each code (see
+    #               seriesTable), and FrameCache.series() finds a cached series by its code. getIta series are
+    #               always named by their codes; seriesKey='code' adds their 'series' table.
+    #
+    # Frequency (getNipa, getIta, getIip) may list several frequencies, e.g. 'A,Q,M' or ['A','Q','M'], to get them
+    # in one request. 'data' is then a dict of frames by frequency, each indexed by a PeriodIndex.
+    #
+    # Parameters that accept several values in one request (Year, GeoFips, KeyCode, LineCode, Indicator,
+    # AreaOrCountry, Industry, Component, ...) may be given as lists. When a list selects several series that would
+    # share a column name, the frame has MultiIndex columns with a level for that parameter, e.g. (Code, GeoName)
+    # for a list of LineCodes.
+
+    def _fetchData(self,method,*args,**kwargs):
+
+        '''Requests and parses the data for one of the get* data methods. Raises BeaError on failure.'''
+
+        params, parse = getattr(self,'_'+method+'Request')(*args,**kwargs)
+        with self._observe(method,params) as metrics:
+            key, result = self._cachedResult(method,params,parse)
+            if result is not None:
+                return result
+            if self.validate:
+                self.catalog.validate(params,fetch=self.validate is True)
+            rJson = self._getSplitJson(params)
+            return self._cacheResult(key,metrics.parse(rJson,parse))
+
+    def _cachedResult(self,method,params,parse):
+
+        '''Looks a call up in the frame cache. Returns its key, or None if there is no frame cache, and the cached
+        result, or None.'''
+
+        if self.frameCache is None:
+            return None, None
+        key = frameKey(method,params,parse)
+        result = self.frameCache.get(key)
+        if result is not None:
+            recordMetrics(frameHits=1)
+        return key, result
+
+    def _cacheResult(self,key,result):
+
+        '''Saves a result to the frame cache under key, if there is one, and returns the result to hand out.'''
+
+        if key is None:
+            return result
+        return self.frameCache.put(key,result)
+
+    # Instrumentation: when there are observers, every data method call collects a CallMetrics, which the code
+    # sending requests finds through currentCall, and the observers receive its event when the call ends.
+
+    def addObserver(self,observer):
+
+        '''Adds a callable that is called with a dict of metrics after every data method call (see CallMetrics).'''
+
+        self.observers.append(observer)
+
+    def removeObserver(self,observer):
+
+        '''Removes an observer added with addObserver() or passed to the constructor.'''
+
+        self.observers.remove(observer)
+
+    @contextlib.contextmanager
+    def _observe(self,method,params):
+
+        '''Context manager collecting the metrics of one data method call and sending them to the observers when the
+        call ends. Yields a CallMetrics, or a NullMetrics that records nothing when there are no observers.'''
+
+        if len(self.observers)==0:
+            yield NullMetrics
+            return
+
+        metrics = CallMetrics(method,params)
+        token = currentCall.set(metrics)
+        try:
+            yield metrics
+        except Exception as e:
+            metrics.event['error'] = e
+            raise
+        finally:
+            currentCall.reset(token)
+            metrics.finish()
+            for observer in list(self.observers):
+                observer(metrics.event)
 
-    def getRegionalData(self,KeyCode=None,GeoFips='STATE',Year='ALL'):
-        '''Retrieve state and regional data.
+    # Requests for very large queries are split into chunks of years or geographies (see _planRequests), sent in
+    # parallel, and the records of the chunks merged into one response before parsing.
 
-        Name        Type    Required?   Multiple values?    "All" Value                     Default
+    def _planRequests(self,params):
 
-        KeyCode     int     yes         no                  N/A                             
-        GeoFips     str     no          yes                 'STATE' or 'COUNTY' or 'MSA'    STATE
-        Year        int     no          yes                 "ALL"                           ALL
-        '''
+        '''Returns the requests to send for params: params itself, or chunks of it if the query is likely to exceed the
+        size limit of the API. Explicit GeoFips lists are split into chunks of chunkGeographies codes, and queries of
+        regional datasets at the county, metro or similar level are split into chunks of chunkYears years.'''
+
+        if not self.splitRequests:
+            return [params]
+
+        chunks = [params]
+        geoFips = params.get('GeoFips')
+        if geoFips is not None and len(str(geoFips).split(','))>chunkGeographies:
+            chunks = splitRequest(params,'GeoFips',str(geoFips).split(','),chunkGeographies)
 
-        # if type(KeyCode)==list:
-        #     KeyCode = ','.join(KeyCode)
+        if requestDataset(params) in regionalDatasets and str(geoFips).upper() in largeGeographies:
+            years = self._years(params)
+            if years is not None and len(years)>chunkYears:
+                chunks = [chunk for request in chunks for chunk in splitRequest(request,'Year',years,chunkYears)]
 
-        # if type(Year)==list:
-        #     Year = [str(y) for y in Year]
-        #     Year = ','.join(Year)
+        return chunks
 
-        # if type(GeoFips)==list:
-        #     GeoFips = ','.join(GeoFips)
+    def _years(self,params):
 
-        uri = 'http://bea.gov/api/data/?UserID='+self.apiKey+'&method=GetData&datasetname=RegionalData&KeyCode='+str(KeyCode)+'&Year='+str(Year)+'&GeoFips='+str(GeoFips)+'&ResultFormat=JSON&'
-        r = requests.get(uri)
-        rJson = r.json()
+        '''Returns the list of years requested by params, looking up the years available in the catalog when all years
+        are requested. Returns None if they are not known.'''
 
-        dataDict = {}
-        # dates = []
-        # YearList = []
-        # name =''
+        year = str(params.get('Year','ALL')).upper()
+        if year not in ('ALL','X'):
+            return [y.strip() for y in year.split(',')]
+        try:
+            records = self.catalog.valueRecords(params['datasetname'],'Year')
+        except (BeaError,KeyError,ValueError):
+            return None
+        years = sorted({str(list(element.values())[0]).strip() for element in records or []})
+        years = [year for year in years if year.isdigit()]
+        return years or None
+
+    def _getSplitJson(self,params,rJson=None):
+
+        '''Returns the decoded response for params, sending the request in chunks if _planRequests() splits it. A chunk
+        that the API rejects as too large is halved by year and sent again. If any chunk fails, BeaError is raised
+        rather than returning the records of the others. rJson is the response to params if it has already been
+        requested.'''
+
+        chunks = [params] if rJson is not None else self._planRequests(params)
+        if len(chunks)==1:
+            if rJson is None:
+                rJson = self._getJson(params)
+            if not isSizeError(rJson):
+                return rJson
+            years = self._years(params)
+            if years is None or len(years)<2:
+                return rJson
+            chunks = splitRequest(params,'Year',years,(len(years)+1)//2)
+
+        contexts = [contextvars.copy_context() for chunk in chunks]
+        with concurrent.futures.ThreadPoolExecutor(max_workers=min(len(chunks),chunkWorkers)) as executor:
+            rJsons = list(executor.map(lambda context,chunk: context.run(self._getSplitJson,chunk),contexts,chunks))
+        return mergeResponses(rJsons,chunks)
+
+    def _getData(self,method,*args,**kwargs):
+
+        '''Requests and parses the data for one of the get* data methods. Prints the error and returns None on failure,
+        unless raiseErrors is set.'''
+
+        try:
+            return self._fetchData(method,*args,**kwargs)
+        except BeaError as e:
+            if self.raiseErrors:
+                raise
+            print('Error: '+str(e))
 
-        columnNames = []
-        dates = []
+    def fetch(self,method,*args,**kwargs):
 
-        try: 
-            for element in rJson['BEAAPI']['Results']['Data']:
-                if element['GeoName'] not in columnNames:
-                    columnNames.append(element['GeoName'])
+        '''Calls the data method named method (e.g. 'getNipa') with the given arguments and returns its result, but
+        raises BeaError on failure, or ValidationError if the request is invalid, whatever raiseErrors is. Takes the
+        data methods accepted by getMany().
 
-                date = convertDate(element['TimePeriod'],'A')
-                if date not in dates:
-                    dates.append(date)
+        Example:
 
-            data = np.zeros([len(dates),len(columnNames)])
-            data[:] = np.nan
-            frame = pd.DataFrame(data,columns = columnNames, index = dates)
+            try:
+                result = bea.fetch('getNipa',TableID='T10101',Frequency='Q')
+            except beapy.BeaError as e:
+                ...
+        '''
 
-            for element in rJson['BEAAPI']['Results']['Data']:
-                date = convertDate(element['TimePeriod'],'A')
-                if 'DataValue' in element.keys():
-                    frame.loc[date,element['GeoName']] = float(element['DataValue'].replace(',',''))
+        return self._fetchData(method,*args,**kwargs)
 
-            frame = frame.sort_index()
-            note = rJson['BEAAPI']['Results']['PublicTable']+' - '+rJson['BEAAPI']['Results']['Statistic']+' - '+rJson['BEAAPI']['Results']['UnitOfMeasure']
-            
-            return {'note':note,'data':frame}
+    # 2.1 Regional Data (statistics by state, county, and MSA)
+
+    def getRegionalData(self,KeyCode=None,GeoFips='STATE',Year='ALL',output='wide',dtype='float64',codes=False,seriesKey='description'):
+        '''Retrieve state and regional data.
+
+        Name        Type    Required?   Multiple values?    "All" Value                     Default
+
+        KeyCode     int     yes         yes                 N/A
+        GeoFips     str     no          yes                 'STATE' or 'COUNTY' or 'MSA'    STATE
+        Year        int     no          yes                 "ALL"                           ALL
+        '''
+
+        return self._getData('getRegionalData',KeyCode,GeoFips,Year,output,dtype,codes,seriesKey)
+
+    def _getRegionalDataRequest(self,KeyCode=None,GeoFips='STATE',Year='ALL',output='wide',dtype='float64',codes=False,seriesKey='description'):
+
+        levels = ['Code'] if isList(KeyCode) else []
+        checkSeriesKey(seriesKey,'RegionalData')
+        params = {'method':'GetData','datasetname':'RegionalData','KeyCode':joinList(KeyCode),'Year':joinList(Year),'GeoFips':joinList(GeoFips),'ResultFormat':'JSON'}
+        return params, functools.partial(parseRegionalData,levels=levels,output=output,dtype=dtype,codes=codes,seriesKey=seriesKey)
 
-        except:
-            print('Invalid input.',sys.exc_info()[0])
 
-    
     # 2.2 NIPA (National Income and Product Accounts)
 
-    def getNipa(self,TableID=None,Frequency='A',Year='X',ShowMillions='N'):
+    def getNipa(self,TableID=None,Frequency='A',Year='X',ShowMillions='N',output='wide',dtype='float64',codes=False,seriesKey='description'):
 
         '''Retrieve data from a NIPA table.
 
         Name            Type    Required?   "All" Value     Default
 
         TableID         int     yes         N/A             None
-        Frequency(A/Q)  str     yes         N/A             None
+        Frequency(A/Q/M) str    yes         N/A             None
         Year            int     yes         "X"             "X"
-        ShowMillions    str     no          N/A             'N'   
+        ShowMillions    str     no          N/A             'N'
         '''
 
-        if Frequency=='M':
-            print('Error: monthly Frequency available for NIPA tables.')
-
-        uri = 'http://bea.gov/api/data/?UserID='+self.apiKey+'&method=GetData&datasetname=NIPA&TableID='+str(TableID)+'&Frequency='+Frequency+'&Year='+str(Year)+'&ShowMillions='+ShowMillions+'&ResultFormat=JSON&'
-        r = requests.get(uri)
-        rJson = r.json()
-
-        columnNames = []
-        dates = []
-        try:
-            for element in rJson['BEAAPI']['Results']['Data']:
-                if element['LineDescription'] not in columnNames:
-                    columnNames.append(element['LineDescription'])
-                
-                date = convertDate(element['TimePeriod'],Frequency)
-                if date not in dates:
-                    dates.append(date)
-
-            data = np.zeros([len(dates),len(columnNames)])
-            data[:] = np.nan
-            frame = pd.DataFrame(data,columns = columnNames, index = dates)
-
-            for element in rJson['BEAAPI']['Results']['Data']:
-                date = convertDate(element['TimePeriod'],Frequency)
-                frame.loc[date,element['LineDescription']] = float(element['DataValue'].replace(',',''))
-            
-            frame = frame.sort_index()
-            note = rJson['BEAAPI']['Results']['Notes'][0]['NoteText']
+        return self._getData('getNipa',TableID,Frequency,Year,ShowMillions,output,dtype,codes,seriesKey)
 
-            return {'note':note,'data':frame}
+    def _getNipaRequest(self,TableID=None,Frequency='A',Year='X',ShowMillions='N',output='wide',dtype='float64',codes=False,seriesKey='description'):
 
-        except:
+        if isList(TableID):
+            raise ValidationError('NIPA accepts one TableID per request. Use getMany() for several tables.','NIPA','TableID',TableID)
 
-            print('Error: invalid input.')
+        checkSeriesKey(seriesKey,'NIPA')
+        params = {'method':'GetData','datasetname':'NIPA','TableID':TableID,'Frequency':joinList(Frequency),'Year':joinList(Year),'ShowMillions':ShowMillions,'ResultFormat':'JSON'}
+        return params, functools.partial(parseNipa,Frequency=joinList(Frequency),output=output,dtype=dtype,codes=codes,seriesKey=seriesKey)
 
     # # 3.3 NIUnderlyingDetail (National Income and Product Accounts)
 
@@ -325,39 +739,18 @@ class initialize:
 
     # 3.4 Fixed Assets
 
-    def getFixedAssets(self,TableID=None,Year='X'):
+    def getFixedAssets(self,TableID=None,Year='X',output='wide',dtype='float64',codes=False,seriesKey='description'):
 
-        uri = 'http://bea.gov/api/data/?UserID='+self.apiKey+'&method=GetData&datasetname=FixedAssets&TableID='+str(TableID)+'&Year='+str(Year)+'&ResultFormat=JSON&'
-        r = requests.get(uri)
-        rJson = r.json()
+        return self._getData('getFixedAssets',TableID,Year,output,dtype,codes,seriesKey)
 
-        columnNames = []
-        dates = []
-        try:
-            for element in rJson['BEAAPI']['Results']['Data']:
-                if element['LineDescription'] not in columnNames:
-                    columnNames.append(element['LineDescription'])
-                
-                date = convertDate(element['TimePeriod'],'A')
-                if date not in dates:
-                    dates.append(date)
-
-            data = np.zeros([len(dates),len(columnNames)])
-            data[:] = np.nan
-            frame = pd.DataFrame(data,columns = columnNames, index = dates)
-
-            for element in rJson['BEAAPI']['Results']['Data']:
-                date = convertDate(element['TimePeriod'],'A')
-                frame.loc[date,element['LineDescription']] = float(element['DataValue'].replace(',',''))
-            
-            frame = frame.sort_index()
-            note = rJson['BEAAPI']['Results']['Notes'][0]['NoteText']
-            
-            return {'note':note,'data':frame}
-
-        except:
-
-            print('Error: invalid input.')
+    def _getFixedAssetsRequest(self,TableID=None,Year='X',output='wide',dtype='float64',codes=False,seriesKey='description'):
+
+        if isList(TableID):
+            raise ValidationError('FixedAssets accepts one TableID per request. Use getMany() for several tables.','FixedAssets','TableID',TableID)
+
+        checkSeriesKey(seriesKey,'FixedAssets')
+        params = {'method':'GetData','datasetname':'FixedAssets','TableID':TableID,'Year':joinList(Year),'ResultFormat':'JSON'}
+        return params, functools.partial(parseFixedAssets,output=output,dtype=dtype,codes=codes,seriesKey=seriesKey)
 
     # 3.5
 
@@ -365,293 +758,2595 @@ class initialize:
 
     # 3.6 Gross domestic product by industry
 
-    def getGdpByIndustry(self,TableID =None, Industry='ALL',Frequency='A',Year = 'ALL'):
+    def getGdpByIndustry(self,TableID =None, Industry='ALL',Frequency='A',Year = 'ALL',output='wide',dtype='float64',codes=False,seriesKey='description'):
 
-        uri = 'http://bea.gov/api/data/?UserID='+self.apiKey+'&method=GetData&datasetname=GDPbyIndustry&TableID='+str(TableID)+'&Industry='+str(Industry)+'&Frequency='+str(Frequency)+'&Year='+str(Year)+'&ResultFormat=JSON&'
-        r = requests.get(uri)
-        rJson = r.json()
+        return self._getData('getGdpByIndustry',TableID,Industry,Frequency,Year,output,dtype,codes,seriesKey)
 
-        columnNames = []
-        dates = []
+    def _getGdpByIndustryRequest(self,TableID =None, Industry='ALL',Frequency='A',Year = 'ALL',output='wide',dtype='float64',codes=False,seriesKey='description'):
 
-        try:
-            for element in rJson['BEAAPI']['Results']['Data']:
-                if element['IndustrYDescription'] not in columnNames:
-                    columnNames.append(element['IndustrYDescription'])
+        levels = [key for key,value in [('TableID',TableID),('Industry',Industry)] if isList(value)]
+        checkSeriesKey(seriesKey,'GDPbyIndustry')
+        # GDPbyIndustry dates come from Year, which cannot tell the periods of several frequencies apart
+        if mixedFrequency(Frequency):
+            raise ValidationError('GDPbyIndustry data can only be requested one frequency at a time.','GDPbyIndustry','Frequency',Frequency)
+        params = {'method':'GetData','datasetname':'GDPbyIndustry','TableID':joinList(TableID),'Industry':joinList(Industry),'Frequency':joinList(Frequency),'Year':joinList(Year),'ResultFormat':'JSON'}
+        return params, functools.partial(parseGdpByIndustry,Frequency=joinList(Frequency),levels=levels,output=output,dtype=dtype,codes=codes,seriesKey=seriesKey)
 
-                date = convertDate(element['Year'],Frequency)
-                if date not in dates:
-                    dates.append(date)
 
-            data = np.zeros([len(dates),len(columnNames)])
-            data[:] = np.nan
-            frame = pd.DataFrame(data,columns = columnNames, index = dates)
 
-            for element in rJson['BEAAPI']['Results']['Data']:
-                date = convertDate(element['Year'],Frequency)
-                frame.loc[date,element['IndustrYDescription']] = float(element['DataValue'].replace(',',''))
-            
-            frame = frame.sort_index()
-            note = rJson['BEAAPI']['Results']['Notes'][0]['NoteText']
+    # 3.7 ITA: International transactions
 
-            return {'note':note,'data':frame}
+    def getIta(self,Indicator=None,AreaOrCountry='ALL',Frequency='A',Year='ALL',output='wide',dtype='float64',codes=False,seriesKey='description'):
 
-        except:
+        return self._getData('getIta',Indicator,AreaOrCountry,Frequency,Year,output,dtype,codes,seriesKey)
 
-            print('Error: invalid input.')
+    def _getItaRequest(self,Indicator=None,AreaOrCountry='ALL',Frequency='A',Year='ALL',output='wide',dtype='float64',codes=False,seriesKey='description'):
 
+        if Indicator=='ALL' and 'ALL' in AreaOrCountry:
+            raise ValidationError('You may not select \'ALL\' for both Indicator and AreaOrCountry','ita','Indicator',Indicator)
+        checkSeriesKey(seriesKey,'ITA')
 
+        if str(joinList(AreaOrCountry)).lower()=='all':
+            levels = ['Indicator'] if isList(Indicator) else []
+        else:
+            levels = ['AreaOrCountry'] if isList(AreaOrCountry) else []
+        params = {'method':'GetData','datasetname':'ita','Indicator':joinList(Indicator),'AreaOrCountry':joinList(AreaOrCountry),'Frequency':joinList(Frequency),'Year':joinList(Year),'ResultFormat':'JSON'}
+        return params, functools.partial(parseIta,AreaOrCountry=joinList(AreaOrCountry),Frequency=joinList(Frequency),levels=levels,output=output,dtype=dtype,codes=codes,seriesKey=seriesKey)
 
-    # 3.7 ITA: International transactions
 
-    def getIta(self,Indicator=None,AreaOrCountry='ALL',Frequency='A',Year='ALL'):
 
-        if Indicator=='ALL' and 'ALL' in AreaOrCountry:
-            print('Warning: You may not select \'ALL\' for both Indicator and AreaOrCountry')
+    # 3.8 IIP: International investment position
 
-        else:
+    def getIip(self,TypeOfInvestment=None,Component=None,Frequency='A',Year='ALL',output='wide',dtype='float64',codes=False,seriesKey='description'):
 
-            uri = 'http://bea.gov/api/data/?UserID='+self.apiKey+'&method=GetData&datasetname=ita&Indicator='+str(Indicator)+'&AreaOrCountry='+str(AreaOrCountry)+'&Year='+str(Year)+'&ResultFormat=JSON&'
-            r = requests.get(uri)
-            rJson = r.json()
+        return self._getData('getIip',TypeOfInvestment,Component,Frequency,Year,output,dtype,codes,seriesKey)
 
-            columnNames = []
-            dates = [] 
+    def _getIipRequest(self,TypeOfInvestment=None,Component=None,Frequency='A',Year='ALL',output='wide',dtype='float64',codes=False,seriesKey='description'):
 
-            try:
+        levels = [key for key,value in [('TypeOfInvestment',TypeOfInvestment),('Component',Component)] if isList(value)]
+        checkSeriesKey(seriesKey,'IIP')
+        params = {'method':'GetData','datasetname':'IIP','TypeOfInvestment':joinList(TypeOfInvestment),'Component':joinList(Component),'Year':joinList(Year),'Frequency':joinList(Frequency),'ResultFormat':'JSON'}
+        return params, functools.partial(parseIip,Frequency=joinList(Frequency),levels=levels,output=output,dtype=dtype,codes=codes,seriesKey=seriesKey)
 
-                if AreaOrCountry.lower()  == 'all':
 
-                    columnNames = []
-                    dates = [] 
 
-                    for element in rJson['BEAAPI']['Results']['Data']:
-                        if element['AreaOrCountry'] not in columnNames:
-                            columnNames.append(element['AreaOrCountry'])
+    # 3.9 Regional Income: detailed regional income and employment data sets.
 
-                            date = convertDate(element['Year'],Frequency)
-                            if date not in dates:
-                                dates.append(date)
+    def getRegionalIncome(self,TableName=None,LineCode=None,GeoFips=None,Year ='ALL',output='wide',dtype='float64',codes=False,seriesKey='description'):
 
-                    data = np.zeros([len(dates),len(columnNames)])
-                    data[:] = np.nan
-                    frame = pd.DataFrame(data,columns = columnNames, index = dates)
+        '''GeoFips can equal STATE
+COUNTY
+MSA
+MIC
+PORT
+DIV
+CSA'''
 
-                    for element in rJson['BEAAPI']['Results']['Data']:
-                        date = convertDate(element['Year'],Frequency)
-                        if len(element['DataValue'].replace(',',''))>0:
-                            frame.loc[date,element['AreaOrCountry']] = float(element['DataValue'].replace(',',''))
-                        else:
-                            frame.loc[date,element['AreaOrCountry']] = np.nan
-                            
-                else:
+        return self._getData('getRegionalIncome',TableName,LineCode,GeoFips,Year,output,dtype,codes,seriesKey)
 
-                    columnNames = []
-                    dates = [] 
+    def _getRegionalIncomeRequest(self,TableName=None,LineCode=None,GeoFips=None,Year ='ALL',output='wide',dtype='float64',codes=False,seriesKey='description'):
 
-                    for element in rJson['BEAAPI']['Results']['Data']:
-                        if element['Indicator'] not in columnNames:
-                            columnNames.append(element['Indicator'])
+        levels = ['Code'] if isList(LineCode) else []
+        checkSeriesKey(seriesKey,'RegionalIncome')
+        params = {'method':'GetData','datasetname':'RegionalIncome','TableName':TableName,'LineCode':joinList(LineCode),'Year':joinList(Year),'GeoFips':joinList(GeoFips),'ResultFormat':'JSON'}
+        return params, functools.partial(parseRegionalIncome,levels=levels,output=output,dtype=dtype,codes=codes,seriesKey=seriesKey)
 
-                            date = convertDate(element['Year'],Frequency)
-                            if date not in dates:
-                                dates.append(date)
 
-                    data = np.zeros([len(dates),len(columnNames)])
-                    data[:] = np.nan
-                    frame = pd.DataFrame(data,columns = columnNames, index = dates)
+    # 3.10 Regional product: detailed state and MSA product data sets
 
+    def getRegionalProduct(self,Component=None,IndustryId=1,GeoFips='State',Year ='ALL',output='wide',dtype='float64',codes=False,seriesKey='description'):
 
+        '''GeoFips can equal either STATE or MSA'''
 
+        return self._getData('getRegionalProduct',Component,IndustryId,GeoFips,Year,output,dtype,codes,seriesKey)
 
+    def _getRegionalProductRequest(self,Component=None,IndustryId=1,GeoFips='State',Year ='ALL',output='wide',dtype='float64',codes=False,seriesKey='description'):
 
-                    for element in rJson['BEAAPI']['Results']['Data']:
-                        date = convertDate(element['Year'],Frequency)
-                        if len(element['DataValue'].replace(',',''))>0:
-                            frame.loc[date,element['Indicator']] = float(element['DataValue'].replace(',',''))
-                        else:
-                            frame.loc[date,element['Indicator']] = np.nan
+        levels = ['Code'] if isList(Component) or isList(IndustryId) else []
+        checkSeriesKey(seriesKey,'regionalProduct')
+        params = {'method':'GetData','datasetname':'regionalProduct','Component':joinList(Component),'IndustryId':joinList(IndustryId),'Year':joinList(Year),'GeoFips':joinList(GeoFips),'ResultFormat':'JSON'}
+        return params, functools.partial(parseRegionalProduct,levels=levels,output=output,dtype=dtype,codes=codes,seriesKey=seriesKey)
 
 
-                frame = frame.sort_index()
-                units  = rJson['BEAAPI']['Results']['Data'][0]['CL_UNIT']
-                mult = rJson['BEAAPI']['Results']['Data'][0]['UNIT_MULT']
-                if int(mult) == 3:
-                    units = 'Thousands of '+units
-                elif int(mult) == 6:
-                    units = 'Millions of '+units
-                elif int(mult) == 9:
-                    units = 'Billions of '+units
-                if Frequency.lower() == 'q':
-                    Notes = rJson['BEAAPI']['Results']['Notes']
-                    for note in Notes:
-                        if note['NoteRef'] == 'Q':
-                            noteQ = note['NoteText']
+    # 3. Batch requests
 
-                    units = units + ', '+ noteQ
-                
-                return {'note':units,'data':frame}
+    def getMany(self,specs,maxWorkers=8,processes=None):
 
-            except:
-                print(rJson['BEAAPI']['Error']['ErrorDetail']['Description'])
+        '''Retrieves many tables or series at once over a pool of threads. specs is either a list of request specs
+        or a dict mapping keys of your choosing to request specs. A request spec is a dict naming one of the get* data
+        methods under 'method' along with that method's arguments, e.g.
 
+            {'method':'getNipa','TableID':'T10101','Frequency':'Q'}
 
+        Returns a dict mapping each key (for a list, a tuple of the sorted spec items) to the usual output of the
+        method. A request that fails maps to {'error':exception} instead and does not stop the rest of the batch.
+        Requests to the API are spaced according to the rateLimit of the instance.
 
-    # 3.8 IIP: International investment position
+        processes moves the decoding and parsing of responses, which otherwise keeps one core busy, to a pool of
+        worker processes: the number of processes, True for one per core, or a ProcessPoolExecutor to reuse (see
+        processPool()). Workers receive the raw response bytes and return frames as Arrow IPC streams when pyarrow
+        is installed.'''
+
+        if isinstance(specs,dict):
+            specs = dict(specs)
+        else:
+            specs = {specKey(spec):spec for spec in specs}
+
+        with processPool(processes) as pool:
+
+            def fetch(spec):
+                spec = dict(spec)
+                method = spec.pop('method')
+                if pool is None:
+                    return self._fetchData(method,**spec)
+                return self._fetchDataInPool(pool,method,**spec)
+
+            results = {}
+            with concurrent.futures.ThreadPoolExecutor(max_workers=maxWorkers) as executor:
+                futures = {executor.submit(fetch,spec):key for key,spec in specs.items()}
+                for future in concurrent.futures.as_completed(futures):
+                    try:
+                        results[futures[future]] = future.result()
+                    except Exception as e:
+                        results[futures[future]] = {'error':e}
+
+        return {key:results[key] for key in specs}
+
+    def _fetchDataInPool(self,pool,method,*args,**kwargs):
+
+        '''Version of _fetchData() that decodes and parses the response in a worker process of pool (see
+        parseBody()). Split requests and streaming responses are handled in this process as usual.'''
+
+        params, parse = getattr(self,'_'+method+'Request')(*args,**kwargs)
+        with self._observe(method,params) as metrics:
+            key, result = self._cachedResult(method,params,parse)
+            if result is not None:
+                return result
+            if self.validate:
+                self.catalog.validate(params,fetch=self.validate is True)
+            if self.streaming or len(self._planRequests(params))>1:
+                return self._cacheResult(key,metrics.parse(self._getSplitJson(params),parse))
+
+            body, status, cached, validators = self._getBody(params)
+            if status!=200:
+                raise BeaError(statusMessage(status,body))
+            packed, records, decodeSeconds, parseSeconds = pool.submit(parseBody,body,parse).result()
+            if packed is None:
+                # Too large for one response: split it here
+                return self._cacheResult(key,metrics.parse(self._getSplitJson(params,decodeJson(body)),parse))
+            metrics.add(records=records,decodeSeconds=decodeSeconds,parseSeconds=parseSeconds)
+
+            if not cached:
+                self._saveBody(params,body,validators)
+            return self._cacheResult(key,unpackFrames(packed))
+
+    # 4. Regional panels
+
+    def getRegionalPanel(self,TableName=None,LineCode=None,GeoFips='STATE',Year='ALL',output='long',dtype='float64',codes=False,maxWorkers=8):
+
+        '''Retrieve a panel of regional income data: the series of several LineCodes of a table for one or more
+        geographies, in one result rather than a frame per LineCode.
+
+        Name        Type            Required?   Default
+
+        TableName   str             yes         None
+        LineCode    int or list     yes         None
+        GeoFips     str or list     no          STATE       levels (STATE, COUNTY, MSA, ...) and/or FIPS codes
+        Year        int or list     no          ALL
+
+        output='long' (default) gives a frame with a (date, GeoFips, LineCode) MultiIndex and a 'value' column, and a
+        'code' column if codes is True. output='array' gives an xarray DataArray with dims (time, GeoFips, LineCode),
+        which requires xarray. The result also holds 'series', the units and multiplier of each LineCode, and
+        'geographies', the name of each GeoFips.
+
+        One request is sent per geography level and LineCode, or per geography level for all the LineCodes if the
+        catalog says the dataset accepts several. The requests run concurrently over maxWorkers threads and the
+        records of all the responses are assembled into the panel at once.'''
+
+        try:
+            return self._fetchRegionalPanel(TableName,LineCode,GeoFips,Year,output,dtype,codes,maxWorkers)
+        except BeaError as e:
+            if self.raiseErrors:
+                raise
+            print('Error: '+str(e))
+
+    def _regionalPanelRequests(self,TableName,LineCode,GeoFips,Year):
 
-    def getIip(self,TypeOfInvestment=None,Component=None,Frequency='A',Year='ALL'):
+        '''Returns the request parameters of a regional panel: one request for each geography level and one for the
+        explicit FIPS codes together, times one for each LineCode unless LineCode accepts several values.'''
 
-        uri = 'http://bea.gov/api/data/?UserID='+self.apiKey+'&method=GetData&datasetname=IIP&TypeOfInvestment='+str(TypeOfInvestment)+'&Component='+str(Component)+'&Year='+str(Year)+'&Frequency='+str(Frequency)+'&ResultFormat=JSON&'
-        r = requests.get(uri)
-        rJson = r.json()
+        lineCodes = list(LineCode) if isList(LineCode) else [LineCode]
+        geographies = [str(g).strip() for g in (GeoFips if isList(GeoFips) else str(GeoFips).split(','))]
+        fips = [g for g in geographies if g.isdigit()]
+        geographies = list(dict.fromkeys(g.upper() for g in geographies if not g.isdigit()))+([fips] if fips else [])
+
+        if self.catalog.acceptsMultiple('RegionalIncome','LineCode',fetch=self.validate is True):
+            lineGroups = [lineCodes]
+        else:
+            lineGroups = [[lineCode] for lineCode in lineCodes]
+        return [self._getRegionalIncomeRequest(TableName,lines if len(lines)>1 else lines[0],geography,Year)[0]
+                for geography in geographies for lines in lineGroups]
 
-        columnNames = []
-        dates = []
+    def _fetchRegionalPanel(self,TableName,LineCode,GeoFips,Year,output,dtype,codes,maxWorkers):
+
+        '''Requests and assembles a regional panel (see getRegionalPanel). Raises BeaError on failure.'''
+
+        if output not in ('long','array'):
+            raise ValidationError('output must be \'long\' or \'array\'.','RegionalIncome','output',output)
+        if output=='array' and optionalImport('xarray') is None:
+            raise ImportError('output=\'array\' requires xarray.')
+
+        panelRequests = self._regionalPanelRequests(TableName,LineCode,GeoFips,Year)
+        params = {'method':'GetData','datasetname':'RegionalIncome','TableName':TableName,'LineCode':joinList(LineCode),'Year':joinList(Year),'GeoFips':joinList(GeoFips),'ResultFormat':'JSON'}
+        with self._observe('getRegionalPanel',params) as metrics:
+            if self.validate:
+                for request in panelRequests:
+                    self.catalog.validate(request,fetch=self.validate is True)
+
+            contexts = [contextvars.copy_context() for request in panelRequests]
+            with concurrent.futures.ThreadPoolExecutor(max_workers=max(1,min(len(panelRequests),maxWorkers))) as executor:
+                rJsons = list(executor.map(lambda context,request: context.run(self._getSplitJson,request),contexts,panelRequests))
+            for request,rJson in zip(panelRequests,rJsons):
+                if isError(rJson):
+                    raise BeaError('LineCode '+str(request['LineCode'])+', GeoFips '+str(request['GeoFips'])+': '+errorMessage(rJson))
+
+            return metrics.parse(mergeResponses(rJsons,panelRequests),functools.partial(parseRegionalPanel,output=output,dtype=dtype,codes=codes))
+
+
+# Asynchronous client
+
+def _asyncDataMethod(name):
+
+    '''Returns a coroutine method of AsyncInitialize that runs the data method name of initialize.'''
+
+    @functools.wraps(getattr(initialize,name))
+    async def method(self,*args,**kwargs):
         try:
-            for element in rJson['BEAAPI']['Data']:
-                if element['TimeSeriesDescription'] not in columnNames:
-                    columnNames.append(element['TimeSeriesDescription'])
-
-                date = convertDate(element['TimePeriod'],Frequency)
-                if date not in dates:
-                    dates.append(date)
-
-            data = np.zeros([len(dates),len(columnNames)])
-            data[:] = np.nan
-            frame = pd.DataFrame(data,columns = columnNames, index = dates)
-
-            for element in rJson['BEAAPI']['Data']:
-                date = convertDate(element['TimePeriod'],Frequency)
-                if len(element['DataValue'].replace(',','')) ==0:
-                    frame.loc[date,element['TimeSeriesDescription']] = np.nan
-                else:
-                    frame.loc[date,element['TimeSeriesDescription']] = float(element['DataValue'].replace(',',''))
-            
-            frame = frame.sort_index()
-            units  = rJson['BEAAPI']['Data'][0]['CL_UNIT']
-            mult = rJson['BEAAPI']['Data'][0]['UNIT_MULT']
-            if int(mult) == 3:
-                units = 'Thousands of '+units
-            elif int(mult) == 6:
-                units = 'Millions of '+units
-            elif int(mult) == 9:
-                units = 'Billions of '+units
+            return await self._fetchDataAsync(name,*args,**kwargs)
+        except BeaError as e:
+            if self.raiseErrors:
+                raise
+            print('Error: '+str(e))
 
-            return {'note':units,'date':frame}
+    return method
 
-        except:
-            print('Error: invalid input.')
 
+class AsyncInitialize(initialize):
 
+    '''Asynchronous version of initialize for use in asyncio programs. The data methods (getNipa, getIta, ...) take
+    the same arguments and give the same results as in initialize, but are coroutines. Requests go through one shared
+    aiohttp connection pool when aiohttp is installed and through the pooled requests session on worker threads
+    otherwise. At most maxConcurrency requests are in flight at once. The cache, rate limit, validation and request
+    splitting work as in initialize. With streaming, responses are streamed on worker threads through the requests
+    session. getRegionalPanel() and changed() are coroutines too, running the methods of initialize on a worker
+    thread. Close the client with close(), or use it as an async context manager.'''
 
-    # 3.9 Regional Income: detailed regional income and employment data sets.
+    def __init__(self,apiKey=None,cache=None,poolSize=10,timeout=(10,120),retries=5,backoff=0.5,rateLimit=100,maxConcurrency=10,streaming=False,catalogPath=None,validate='cached',splitRequests=True,observers=None,frameCache=None,baseUrl=None,raiseErrors=False):
 
-    def getRegionalIncome(self,TableName=None,LineCode=None,GeoFips=None,Year ='ALL'):
+        initialize.__init__(self,apiKey,cache=cache,poolSize=poolSize,timeout=timeout,retries=retries,backoff=backoff,rateLimit=rateLimit,streaming=streaming,catalogPath=catalogPath,validate=validate,splitRequests=splitRequests,
+                            observers=observers,frameCache=frameCache,baseUrl=baseUrl,raiseErrors=raiseErrors)
+        self.semaphore = asyncio.Semaphore(maxConcurrency)
+        self.asyncSession = None
 
-        '''GeoFips can equal STATE
-COUNTY
-MSA
-MIC
-PORT
-DIV
-CSA'''
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self,*exc):
+        await self.close()
+
+    async def close(self):
+
+        '''Closes the connection pools.'''
+
+        if self.asyncSession is not None:
+            await self.asyncSession.close()
+            self.asyncSession = None
+        if self._session is not None:
+            self._session.close()
 
-        uri = 'http://bea.gov/api/data/?UserID='+self.apiKey+'&method=GetData&datasetname=RegionalIncome&TableName='+str(TableName)+'&LineCode='+str(LineCode)+'&Year='+str(Year)+'&GeoFips='+str(GeoFips)+'&ResultFormat=JSON&'
-        r = requests.get(uri)
-        rJson = r.json()
+    async def _httpGet(self,params):
 
-        columnNames = []
-        dates = []
-        Frequency = 'A'
+        '''Sends one request and returns the HTTP status and raw body. Retries as in initialize.'''
+
+        params = {key:str(value) for key,value in dict(UserID=self.apiKey,**params).items() if value is not None}
+
+        aiohttp = optionalImport('aiohttp')
+        if aiohttp is None:
+            r = await asyncio.to_thread(self._retryTruncated,lambda: self.session.get(self.url,params=params,timeout=self.timeout))
+            recordResponse(r)
+            return r.status_code, r.content
+
+        if self.asyncSession is None:
+            if isinstance(self.timeout,tuple):
+                timeout = aiohttp.ClientTimeout(sock_connect=self.timeout[0],sock_read=self.timeout[1])
+            else:
+                timeout = aiohttp.ClientTimeout(total=self.timeout)
+            self.asyncSession = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=self.poolSize),timeout=timeout)
+
+        for attempt in range(self.retries+1):
+            delay = None
+            try:
+                async with self.asyncSession.get(self.url,params=params) as r:
+                    body = await r.read()
+                    if r.status not in retryStatuses or attempt==self.retries:
+                        recordMetrics(retries=attempt)
+                        return r.status, body
+                    delay = retryAfterSeconds(r.headers.get('Retry-After'))
+            except (aiohttp.ClientError,asyncio.TimeoutError):
+                if attempt==self.retries:
+                    raise
+            if delay is None:
+                delay = self.backoff*2**attempt
+            await asyncio.sleep(delay)
+
+    async def _getJsonAsync(self,params):
+
+        '''Asynchronous version of initialize._getJson().'''
+
+        if self.streaming:
+            async with self.semaphore:
+                return await asyncio.to_thread(self._streamJson,params)
+
+        if self.cache is not None:
+            body = await asyncio.to_thread(self.cache.get,params)
+            if body is not None:
+                recordMetrics(cacheHits=1)
+                return decodeJson(body)
+            recordMetrics(cacheMisses=1)
+
+        async with self.semaphore:
+            if self.rateLimiter is not None:
+                delay = self.rateLimiter.acquire()
+                while delay>0:
+                    await asyncio.sleep(delay)
+                    delay = self.rateLimiter.acquire()
+            start = time.perf_counter()
+            status, body = await self._httpGet(params)
+            recordMetrics(requests=1,httpSeconds=time.perf_counter()-start,bytes=len(body))
+
+        if status!=200:
+            raise BeaError(statusMessage(status,body))
+        rJson = decodeJson(body)
+
+        if self.cache is not None and not isError(rJson):
+            await asyncio.to_thread(self.cache.put,params,body)
+
+        return rJson
+
+    async def _fetchDataAsync(self,method,*args,**kwargs):
+
+        '''Asynchronous version of initialize._fetchData(). Parsing runs on a worker thread so that large responses do
+        not stall the event loop.'''
+
+        params, parse = getattr(self,'_'+method+'Request')(*args,**kwargs)
+        with self._observe(method,params) as metrics:
+            key, result = self._cachedResult(method,params,parse)
+            if result is not None:
+                return result
+            if self.validate:
+                await asyncio.to_thread(self.catalog.validate,params,self.validate is True)
+            rJson = await self._getSplitJsonAsync(params)
+            return self._cacheResult(key,await asyncio.to_thread(metrics.parse,rJson,parse))
+
+    async def _getSplitJsonAsync(self,params):
+
+        '''Asynchronous version of initialize._getSplitJson().'''
+
+        chunks = await asyncio.to_thread(self._planRequests,params)
+        if len(chunks)==1:
+            rJson = await self._getJsonAsync(params)
+            if not isSizeError(rJson):
+                return rJson
+            years = await asyncio.to_thread(self._years,params)
+            if years is None or len(years)<2:
+                return rJson
+            chunks = splitRequest(params,'Year',years,(len(years)+1)//2)
+
+        rJsons = await asyncio.gather(*[self._getSplitJsonAsync(chunk) for chunk in chunks])
+        return mergeResponses(rJsons,chunks)
+
+    async def fetch(self,method,*args,**kwargs):
+
+        '''Asynchronous version of initialize.fetch(): raises BeaError on failure whatever raiseErrors is.'''
+
+        return await self._fetchDataAsync(method,*args,**kwargs)
+
+    async def getMany(self,specs):
+
+        '''Asynchronous version of initialize.getMany(). Concurrency is bounded by maxConcurrency.'''
+
+        if not isinstance(specs,dict):
+            specs = {specKey(spec):spec for spec in specs}
+
+        async def fetch(spec):
+            spec = dict(spec)
+            method = spec.pop('method')
+            try:
+                return await self._fetchDataAsync(method,**spec)
+            except Exception as e:
+                return {'error':e}
+
+        results = await asyncio.gather(*[fetch(spec) for spec in specs.values()])
+        return dict(zip(specs.keys(),results))
+
+    getRegionalData = _asyncDataMethod('getRegionalData')
+    getNipa = _asyncDataMethod('getNipa')
+    getFixedAssets = _asyncDataMethod('getFixedAssets')
+    getGdpByIndustry = _asyncDataMethod('getGdpByIndustry')
+    getIta = _asyncDataMethod('getIta')
+    getIip = _asyncDataMethod('getIip')
+    getRegionalIncome = _asyncDataMethod('getRegionalIncome')
+    getRegionalProduct = _asyncDataMethod('getRegionalProduct')
+
+    @functools.wraps(initialize.getRegionalPanel)
+    async def getRegionalPanel(self,*args,**kwargs):
+        return await asyncio.to_thread(initialize.getRegionalPanel,self,*args,**kwargs)
+
+    @functools.wraps(initialize.changed)
+    async def changed(self,*args,**kwargs):
+        return await asyncio.to_thread(initialize.changed,self,*args,**kwargs)
+
+
+# Response cache
+
+class ResponseCache:
+
+    '''Persistent cache of raw BEA API responses kept in a SQLite file. Entries are keyed on the canonical request
+    parameters (names and values are case-insensitive; UserID and ResultFormat are ignored) and stored zlib
+    compressed.
+
+        path        str     location of the SQLite file. Default: ~/.beapy/cache.sqlite
+        ttl         dict    seconds an entry stays fresh, by dataset name (lower case). Use the key 'default' for
+                            datasets not listed. A value of None means never expire.
+        maxBytes    int     limit on the total compressed size of the cache. Least recently used entries are
+                            dropped first.
+        releases    dict    release datetimes, by dataset name (lower case). An entry saved before a release that
+                            has since passed is stale regardless of its ttl.
+
+    Each entry also keeps the ETag and Last-Modified headers of the response, if the server sent them, and a content
+    hash of the body. Expired entries with such validators are kept (until evicted) so that initialize can renew them
+    with a conditional request instead of downloading them again.
+    '''
+
+    def __init__(self,path=None,ttl=None,maxBytes=512*1024**2,releases=None):
+
+        if path is None:
+            path = os.path.join(os.path.expanduser('~'),'.beapy','cache.sqlite')
+        directory = os.path.dirname(os.path.abspath(path))
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+        self.path = path
+        self.ttl = {'default':24*3600}
+        if ttl is not None:
+            self.ttl.update({key.lower():value for key,value in ttl.items()})
+        self.maxBytes = maxBytes
+        self.releases = {}
+        if releases is not None:
+            self.releases = {key.lower():sorted(value) for key,value in releases.items()}
+        self._lock = threading.Lock()
+
+        with self._connect() as connection:
+            connection.execute('CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, dataset TEXT, created REAL, accessed REAL, size INTEGER, body BLOB, etag TEXT, lastModified TEXT, hash TEXT)')
+            columns = [row[1] for row in connection.execute('PRAGMA table_info(responses)')]
+            for column in ['etag','lastModified','hash']:
+                if column not in columns:
+                    connection.execute('ALTER TABLE responses ADD COLUMN '+column+' TEXT')
+            connection.execute('CREATE INDEX IF NOT EXISTS responses_dataset ON responses (dataset)')
+            connection.execute('CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)')
+
+    @contextlib.contextmanager
+    def _connect(self):
+        connection = sqlite3.connect(self.path,timeout=30)
         try:
-            for element in rJson['BEAAPI']['Results']['Data']:
-                if element['GeoName'] not in columnNames:
-                    columnNames.append(element['GeoName'])
-
-                date = convertDate(element['TimePeriod'],Frequency)
-                if date not in dates:
-                    dates.append(date)
-
-            data = np.zeros([len(dates),len(columnNames)])
-            data[:] = np.nan
-            frame = pd.DataFrame(data,columns = columnNames, index = dates)
-
-            for element in rJson['BEAAPI']['Results']['Data']:
-                date = convertDate(element['TimePeriod'],Frequency)
-                if len(element['DataValue'].replace(',','')) ==0:
-                    frame.loc[date,element['GeoName']] = np.nan
+            with connection:
+                yield connection
+        finally:
+            connection.close()
+
+    def _isStale(self,dataset,created,now):
+
+        ttl = self.ttl.get(dataset,self.ttl['default'])
+        if ttl is not None and now-created>ttl:
+            return True
+        for release in self.releases.get(dataset,[]):
+            release = release.timestamp()
+            if created<release<=now:
+                return True
+        return False
+
+    def get(self,params,compressed=False):
+
+        '''Returns the raw response body saved for params, or None if there is no fresh entry. If compressed is True,
+        the body is returned zlib compressed.'''
+
+        key = requestKey(params)
+        now = time.time()
+        with self._lock, self._connect() as connection:
+            row = connection.execute('SELECT dataset, created, body, etag, lastModified FROM responses WHERE key=?',(key,)).fetchone()
+            if row is None:
+                return None
+            dataset, created, body, etag, lastModified = row
+            if self._isStale(dataset,created,now):
+                if etag is None and lastModified is None:
+                    connection.execute('DELETE FROM responses WHERE key=?',(key,))
+                return None
+            connection.execute('UPDATE responses SET accessed=? WHERE key=?',(now,key))
+        if compressed:
+            return bytes(body)
+        return zlib.decompress(body)
+
+    def put(self,params,body,compressed=False,etag=None,lastModified=None):
+
+        '''Saves the raw response body for params, with the ETag and Last-Modified headers of the response if given,
+        and evicts least recently used entries above maxBytes. If compressed is True, body is already zlib
+        compressed.'''
+
+        key = requestKey(params)
+        dataset = requestDataset(params)
+        if compressed:
+            bodyHash = contentHash(zlib.decompress(body))
+        else:
+            bodyHash = contentHash(body)
+            body = zlib.compress(body)
+        now = time.time()
+        with self._lock, self._connect() as connection:
+            connection.execute('INSERT OR REPLACE INTO responses (key, dataset, created, accessed, size, body, etag, lastModified, hash) VALUES (?,?,?,?,?,?,?,?,?)',
+                               (key,dataset,now,now,len(body),sqlite3.Binary(body),etag,lastModified,bodyHash))
+            total = connection.execute('SELECT COALESCE(SUM(size),0) FROM responses').fetchone()[0]
+            if total>self.maxBytes:
+                for oldKey, size in connection.execute('SELECT key, size FROM responses ORDER BY accessed').fetchall():
+                    if total<=self.maxBytes:
+                        break
+                    connection.execute('DELETE FROM responses WHERE key=?',(oldKey,))
+                    total-=size
+
+    def validators(self,params):
+
+        '''Returns the ETag and Last-Modified headers saved with the response for params, fresh or expired, as a dict
+        for conditionalHeaders(). Returns None if there is no entry or it has neither.'''
+
+        with self._lock, self._connect() as connection:
+            row = connection.execute('SELECT etag, lastModified FROM responses WHERE key=?',(requestKey(params),)).fetchone()
+        if row is None or (row[0] is None and row[1] is None):
+            return None
+        return {key:value for key,value in zip(['etag','lastModified'],row) if value is not None}
+
+    def revalidate(self,params):
+
+        '''Marks the response saved for params as fresh again, after the server answered that it has not been
+        modified, and returns its body. Returns None if there is no entry.'''
+
+        key = requestKey(params)
+        now = time.time()
+        with self._lock, self._connect() as connection:
+            row = connection.execute('SELECT body FROM responses WHERE key=?',(key,)).fetchone()
+            if row is None:
+                return None
+            connection.execute('UPDATE responses SET created=?, accessed=? WHERE key=?',(now,now,key))
+        return zlib.decompress(row[0])
+
+    def contentHash(self,params):
+
+        '''Returns the content hash of the response saved for params, fresh or expired, or None.'''
+
+        with self._lock, self._connect() as connection:
+            row = connection.execute('SELECT hash FROM responses WHERE key=?',(requestKey(params),)).fetchone()
+        return None if row is None else row[0]
+
+    def invalidate(self,dataset=None):
+
+        '''Removes the saved responses for dataset, or every saved response if dataset is None.'''
+
+        with self._lock, self._connect() as connection:
+            if dataset is None:
+                connection.execute('DELETE FROM responses')
+            else:
+                connection.execute('DELETE FROM responses WHERE dataset=?',(dataset.lower(),))
+
+    def info(self):
+
+        '''Returns the number of entries and total compressed bytes in the cache.'''
+
+        with self._lock, self._connect() as connection:
+            entries, size = connection.execute('SELECT COUNT(*), COALESCE(SUM(size),0) FROM responses').fetchone()
+        return {'entries':entries,'bytes':size}
+
+
+# Cache of parsed results
+
+class FrameCache:
+
+    '''In-memory LRU cache of the parsed results of data method calls, for processes that make the same calls
+    repeatedly (e.g. dashboards). Pass an instance as the frameCache of initialize. Entries are keyed on the method,
+    its normalized request parameters and its output options, so getNipa('T10101','Q') and
+    getNipa(TableID='t10101',Frequency='q') share an entry.
+
+        maxBytes    int     limit on the total memory of the cached frames. Least recently used entries are dropped
+                            first. A result larger than maxBytes is not cached.
+        ttl         float   seconds an entry stays fresh. None (default) means until evicted.
+
+    Results are handed out as copies, so callers cannot corrupt cached entries. With pandas copy-on-write (always on
+    from pandas 3) these are cheap shallow copies; otherwise frames are copied in full. info() returns the hit and
+    miss counts.
+
+    The series of cached results keyed by codes (seriesKey='code', wide layouts) are also indexed by code, so
+    series(code) returns one series and seriesInfo(code) its description and units from whichever cached table
+    holds it, without searching the tables. Where tables share a code, the most recently cached one is used.
+    '''
+
+    def __init__(self,maxBytes=256*1024**2,ttl=None):
+
+        self.maxBytes = maxBytes
+        self.ttl = ttl
+        self._entries = collections.OrderedDict()
+        self._series = {}
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self,key):
+
+        '''Returns a copy of the result cached under key, or None if there is no fresh entry.'''
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self.ttl is not None and time.time()-entry[2]>self.ttl:
+                self._remove(key)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+        return copyResult(entry[0])
+
+    def put(self,key,result):
+
+        '''Caches result under key, evicting least recently used entries above maxBytes, and returns a copy of it for
+        the caller.'''
+
+        size = resultBytes(result)
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            if size<=self.maxBytes:
+                self._entries[key] = (result,size,time.time())
+                self._bytes += size
+                for code in seriesCodes(result):
+                    self._series[code] = key
+                while self._bytes>self.maxBytes:
+                    self._remove(next(iter(self._entries)))
+                    self.evictions += 1
+        return copyResult(result)
+
+    def _remove(self,key):
+
+        result, size, created = self._entries.pop(key)
+        self._bytes -= size
+        for code in seriesCodes(result):
+            if self._series.get(code)==key:
+                del self._series[code]
+
+    def _seriesEntry(self,code):
+
+        key = self._series.get(code)
+        if key is None:
+            return None
+        entry = self._entries[key]
+        if self.ttl is not None and time.time()-entry[2]>self.ttl:
+            self._remove(key)
+            return None
+        self._entries.move_to_end(key)
+        return entry[0]
+
+    def series(self,code):
+
+        '''Returns the cached series with the given code (a tuple for MultiIndex columns), or None if no cached
+        table holds it. For mixed-frequency results, returns a dict of series by frequency.'''
+
+        with self._lock:
+            result = self._seriesEntry(code)
+            if result is None:
+                return None
+            data = result['data'] if 'data' in result else result['date']
+        deep = not copyOnWrite()
+        if isinstance(data,dict):
+            return {frequency:frame[code].copy(deep=deep) for frequency,frame in data.items() if code in frame.columns}
+        return data[code].copy(deep=deep)
+
+    def seriesInfo(self,code):
+
+        '''Returns the row of the 'series' table for the cached series with the given code as a dict (description,
+        units, multiplier, ...), or None if no cached table holds it.'''
+
+        with self._lock:
+            result = self._seriesEntry(code)
+        if result is None:
+            return None
+        return result['series'].loc[code].to_dict()
+
+    def invalidate(self,method=None):
+
+        '''Removes the cached results of one data method (e.g. 'getNipa'), or every cached result if method is None.'''
+
+        with self._lock:
+            for key in list(self._entries):
+                if method is None or key[0]==method:
+                    self._remove(key)
+
+    def info(self):
+
+        '''Returns the number of entries, their total bytes, the number of indexed series, and the hit, miss and
+        eviction counts.'''
+
+        with self._lock:
+            return {'entries':len(self._entries),'bytes':self._bytes,'series':len(self._series),'hits':self.hits,'misses':self.misses,'evictions':self.evictions}
+
+
+# Metadata catalog
+
+class Catalog:
+
+    '''Index of the datasets, parameters and parameter values of the BEA API. Each list is requested from the API
+    once and kept in memory and, if path is given, in a JSON file so that later sessions need no requests. Lists
+    older than maxAge seconds are requested again. The lists are available as records (lists of dicts) and as
+    indexed DataFrames, e.g. the NIPA tables with quarterly data starting before 1960:
+
+        bea.catalog.query('NIPA','Year','FirstQuarterlyYear < 1960').index
+    '''
+
+    def __init__(self,client,path=None,maxAge=7*24*3600):
+
+        self.client = client
+        self.path = path
+        self.maxAge = maxAge
+        self._entries = {}
+        self._frames = {}
+        self._lock = threading.Lock()
+
+        if path is not None and os.path.isfile(path):
+            try:
+                with open(path) as catalogFile:
+                    self._entries = json.load(catalogFile)
+            except (OSError,ValueError):
+                # An unreadable catalog is requested again and overwritten
+                self._entries = {}
+
+    def _save(self):
+
+        if self.path is None:
+            return
+        directory = os.path.dirname(os.path.abspath(self.path))
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        # Sessions sharing the file each write their own temporary file
+        temporary = self.path+'.'+str(os.getpid())+'.'+str(threading.get_ident())+'.tmp'
+        with open(temporary,'w') as catalogFile:
+            json.dump(self._entries,catalogFile)
+        os.replace(temporary,self.path)
+
+    def _records(self,key,params,field,fetch=True):
+
+        entry = self._entries.get(key)
+        if not fetch:
+            return None if entry is None else entry['records']
+        if entry is None or (self.maxAge is not None and time.time()-entry['fetched']>self.maxAge):
+            rJson = self.client._getJson(params)
+            if isError(rJson):
+                raise BeaError(errorMessage(rJson))
+            entry = {'fetched':time.time(),'records':rJson['BEAAPI']['Results'].get(field,[])}
+            with self._lock:
+                self._entries[key] = entry
+                self._frames.pop(key,None)
+                self._save()
+        return entry['records']
+
+    def _frame(self,key,records):
+
+        frame = self._frames.get(key)
+        if frame is None:
+            frame = pd.DataFrame(list(records))
+            for column in frame.columns:
+                values = frame[column].replace('',np.nan)
+                numbers = pd.to_numeric(values,errors='coerce')
+                if numbers.notna().sum()==values.notna().sum():
+                    frame[column] = numbers
+            if frame.shape[1]>0:
+                frame = frame.set_index(frame.columns[0])
+            self._frames[key] = frame
+        return frame
+
+    def datasetRecords(self):
+
+        '''Returns the list of datasets as returned by GETDATASETLIST.'''
+
+        return self._records('datasets',{'method':'GETDATASETLIST','ResultFormat':'JSON'},'Dataset')
+
+    def parameterRecords(self,dataSetName,fetch=True):
+
+        '''Returns the list of parameters of a dataset as returned by GETPARAMETERLIST. If fetch is False, returns
+        None instead of requesting a list that is not in the catalog.'''
+
+        return self._records('parameters/'+dataSetName.lower(),{'method':'GETPARAMETERLIST','datasetname':dataSetName,'ResultFormat':'JSON'},'Parameter',fetch)
+
+    def acceptsMultiple(self,dataSetName,parameterName,fetch=False):
+
+        '''Returns True if a parameter of a dataset accepts several comma separated values, False if it does not, and
+        None if that is not known (see parameterRecords for fetch).'''
+
+        for element in self.parameterRecords(dataSetName,fetch) or []:
+            if element['ParameterName'].lower()==parameterName.lower():
+                return str(element.get('MultipleAcceptedFlag')).lower() in ('1','true')
+        return None
+
+    def valueRecords(self,dataSetName,parameterName,fetch=True):
+
+        '''Returns the list of values of a parameter of a dataset as returned by GetParameterValues. If fetch is False,
+        returns None instead of requesting a list that is not in the catalog.'''
+
+        return self._records('values/'+dataSetName.lower()+'/'+parameterName.lower(),{'method':'GetParameterValues','datasetname':dataSetName,'ParameterName':parameterName,'ResultFormat':'JSON'},'ParamValue',fetch)
+
+    def _aliasedValueRecords(self,dataSetName,parameterName,fetch):
+
+        records = self.valueRecords(dataSetName,parameterName,False)
+        alias = parameterAliases.get(parameterName.lower())
+        if records is None and alias is not None:
+            records = self.valueRecords(dataSetName,alias,False)
+        if records is None and fetch:
+            try:
+                records = self.valueRecords(dataSetName,parameterName)
+            except BeaError:
+                if alias is None:
+                    raise
+                records = self.valueRecords(dataSetName,alias)
+        return records
+
+    def validate(self,params,fetch=False):
+
+        '''Checks the parameters of a GetData request against the catalog and raises ValidationError if the request
+        cannot succeed. Only lists already in the catalog are used unless fetch is True. The checks are:
+
+            - Frequency is one or more of the frequencies the dataset accepts (A, Q, M, QSA, QNSA, ...)
+            - required parameters of the dataset are given
+            - table, indicator, component, industry and key codes are accepted values of their parameter
+            - for NIPA and FixedAssets tables, the table has data at each requested frequency and in at least one of
+              the requested years
+        '''
+
+        dataset = params.get('datasetname')
+        if dataset is None:
+            return
+        given = {key.lower():value for key,value in params.items() if value is not None}
+
+        frequencies = []
+        if 'frequency' in given:
+            frequencies = [f.strip().upper() for f in str(given['frequency']).split(',')]
+            try:
+                records = self._aliasedValueRecords(dataset,'Frequency',fetch)
+            except BeaError:
+                records = None
+            if records:
+                accepted = {str(list(element.values())[0]).strip().upper() for element in records}
+                for f in frequencies:
+                    if f not in accepted and f!='ALL':
+                        raise ValidationError(f+' is not a valid Frequency for the '+dataset+' dataset.',dataset,'Frequency',given['frequency'])
+
+        parameters = self.parameterRecords(dataset,fetch)
+        for element in parameters or []:
+            name = element['ParameterName'].lower()
+            required = str(element.get('ParameterIsRequiredFlag')).lower() in ('1','true')
+            names = [name]+[alias for alias,target in parameterAliases.items() if target==name]
+            if required and not any(n in given for n in names) and str(element.get('ParameterDefaultValue','')).strip()=='':
+                raise ValidationError(element['ParameterName']+' is required for the '+dataset+' dataset.',dataset,element['ParameterName'],None)
+
+        for key,value in params.items():
+            if value is None or key.lower() not in codeParameters:
+                continue
+            records = self._aliasedValueRecords(dataset,key,fetch)
+            if not records:
+                continue
+            accepted = {str(list(element.values())[0]).strip().upper() for element in records}
+            for item in str(value).split(','):
+                item = item.strip().upper()
+                if item not in accepted and item not in ('ALL','X'):
+                    raise ValidationError(str(item)+' is not a valid '+key+' for the '+dataset+' dataset.',dataset,key,value)
+
+        table = given.get('tableid',given.get('tablename'))
+        if dataset.lower() in ('nipa','fixedassets') and table is not None:
+            records = self.valueRecords(dataset,'Year',fetch)
+            ranges = {str(list(element.values())[0]).strip().upper():element for element in records or []}
+            element = ranges.get(str(table).strip().upper())
+            if element is not None:
+                years = str(given.get('year','X')).upper()
+                years = [] if years in ('X','ALL') else [int(year) for year in years.split(',') if year.strip().isdigit()]
+                for f in frequencies or ['A']:
+                    word = {'A':'Annual','Q':'Quarterly','M':'Monthly'}.get(f[:1])
+                    if word is None:
+                        continue
+                    first = str(element.get('First'+word+'Year','')).strip()
+                    last = str(element.get('Last'+word+'Year','')).strip()
+                    if not first.isdigit() or not last.isdigit():
+                        raise ValidationError('Table '+str(table)+' has no '+word.lower()+' data.',dataset,'Frequency',given.get('frequency'))
+                    if years and not any(int(first)<=year<=int(last) for year in years):
+                        raise ValidationError('Table '+str(table)+' has '+word.lower()+' data for '+first+'-'+last+' only.',dataset,'Year',given.get('year'))
+
+    def datasets(self):
+
+        '''Returns a DataFrame of the datasets indexed by DatasetName.'''
+
+        return self._frame('datasets',self.datasetRecords())
+
+    def parameters(self,dataSetName):
+
+        '''Returns a DataFrame of the parameters of a dataset indexed by ParameterName.'''
+
+        return self._frame('parameters/'+dataSetName.lower(),self.parameterRecords(dataSetName))
+
+    def values(self,dataSetName,parameterName):
+
+        '''Returns a DataFrame of the values of a parameter of a dataset, indexed by the first field of the values
+        (e.g. TableName or Key). Fields holding only numbers, like the first and last years of NIPA tables, are
+        numeric.'''
+
+        return self._frame('values/'+dataSetName.lower()+'/'+parameterName.lower(),self.valueRecords(dataSetName,parameterName))
+
+    def query(self,dataSetName,parameterName,expression):
+
+        '''Returns the values of a parameter of a dataset selected by a DataFrame.query() expression.'''
+
+        return self.values(dataSetName,parameterName).query(expression)
+
+    def search(self,text,dataSetName=None,parameterName=None,limit=10):
+
+        '''Fuzzy search of the descriptions of parameter values, e.g. the descriptions of tables or lines. Searches
+        the values of parameterName in dataSetName if both are given, otherwise every list of values already in the
+        catalog. Returns up to limit matches, best first, as a DataFrame with the dataset, parameter, value, its
+        description and a score between 0 and 1.'''
+
+        if dataSetName is not None and parameterName is not None:
+            self.valueRecords(dataSetName,parameterName)
+            prefix = 'values/'+dataSetName.lower()+'/'+parameterName.lower()
+        elif dataSetName is not None:
+            prefix = 'values/'+dataSetName.lower()+'/'
+        else:
+            prefix = 'values/'
+
+        text = text.lower()
+        words = text.split()
+        matches = []
+        for key,entry in list(self._entries.items()):
+            if not key.startswith(prefix):
+                continue
+            dataset, parameter = key.split('/')[1:3]
+            for element in entry['records']:
+                fields = list(element.values())
+                description = ' '.join(str(value) for value in fields[1:]) if len(fields)>1 else str(fields[0])
+                target = description.lower()
+                if text in target:
+                    score = 1.0
                 else:
-                    frame.loc[date,element['GeoName']] = float(element['DataValue'].replace(',',''))
-            frame = frame.sort_index()
+                    found = sum(word in target for word in words)/max(len(words),1)
+                    score = max(0.9*found,difflib.SequenceMatcher(None,text,target).ratio())
+                matches.append((score,dataset,parameter,fields[0],description))
 
-            units = rJson['BEAAPI']['Results']['UnitOfMeasure']
+        matches.sort(key=lambda match:-match[0])
+        return pd.DataFrame([match[1:]+match[:1] for match in matches[:limit]],columns=['Dataset','Parameter','Value','Description','Score'])
 
-            return {'notes':units,'data':frame}
 
-        except:
+# Local data store
 
-                print('Error: invalid input.')
+class DataStore:
 
+    '''Local store of data series downloaded with the data methods of an initialize instance. Each series, i.e. a
+    data method with its arguments other than Year, is kept as Parquet files partitioned by year and is memory-mapped
+    when read back with load(). refresh() requests only the years that are missing or may have been revised since the
+    last refresh and merges them into the store. Requires pyarrow.
 
-    # 3.10 Regional product: detailed state and MSA product data sets
+        client          initialize instance used for downloads
+        path            directory of the store. Default: ~/.beapy/store
+        revisionYears   number of the most recent stored years requested again on each refresh, since BEA revises
+                        recent history on release dates.
 
-    def getRegionalProduct(self,Component=None,IndustryId=1,GeoFips='State',Year ='ALL'):
+    Example:
 
-        '''GeoFips can equal either STATE or MSA'''
+        store = beapy.DataStore(beapy.initialize(apiKey))
+        store.refresh('getNipa',TableID='T10101',Frequency='Q')
+        frame = store.load('getNipa',TableID='T10101',Frequency='Q')['data']
+    '''
+
+    def __init__(self,client,path=None,revisionYears=3):
+
+        if optionalImport('pyarrow.parquet') is None:
+            raise ImportError('DataStore requires pyarrow.')
+
+        if path is None:
+            path = os.path.join(os.path.expanduser('~'),'.beapy','store')
+        if not os.path.isdir(path):
+            os.makedirs(path)
+
+        self.client = client
+        self.path = path
+        self.revisionYears = revisionYears
+
+    def _directory(self,method,params):
+
+        name = ','.join(key+'='+str(params[key]) for key in sorted(params))
+        return os.path.join(self.path,method,urllib.parse.quote(name,safe='=,'))
+
+    def _years(self,directory):
+
+        years = []
+        if os.path.isdir(directory):
+            for fileName in os.listdir(directory):
+                if fileName.startswith('year=') and fileName.endswith('.parquet'):
+                    years.append(int(fileName[5:-8]))
+        return sorted(years)
+
+    def _request(self,method,params):
+
+        '''Returns the arguments for refreshing a series: all years for a new series, otherwise the last
+        revisionYears stored years and every year since.'''
+
+        years = self._years(self._directory(method,params))
+        if len(years)==0:
+            return dict(params)
+        first = max(years[-1]-self.revisionYears+1,years[0])
+        return dict(params,Year=','.join(str(year) for year in range(first,datetime.date.today().year+1)))
+
+    def _write(self,method,params,result):
+
+        directory = self._directory(method,params)
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+        frameKey = [key for key,value in result.items() if isinstance(value,pd.DataFrame)][0]
+        frame = result[frameKey]
+        for year, part in frame.groupby(frame.index.year):
+            fileName = os.path.join(directory,'year='+str(year)+'.parquet')
+            pyarrow.parquet.write_table(pyarrow.Table.from_pandas(part),fileName+'.tmp')
+            os.replace(fileName+'.tmp',fileName)
+
+        meta = {'method':method,'params':params,'frameKey':frameKey,'refreshed':time.time(),
+                'notes':{key:value for key,value in result.items() if not isinstance(value,pd.DataFrame)}}
+        with open(os.path.join(directory,'meta.json.tmp'),'w') as metaFile:
+            json.dump(meta,metaFile)
+        os.replace(os.path.join(directory,'meta.json.tmp'),os.path.join(directory,'meta.json'))
+
+    def series(self):
+
+        '''Returns the (method, params) pairs of the series in the store.'''
+
+        series = []
+        for root, directories, fileNames in os.walk(self.path):
+            if 'meta.json' in fileNames:
+                with open(os.path.join(root,'meta.json')) as metaFile:
+                    meta = json.load(metaFile)
+                series.append((meta['method'],meta['params']))
+        return sorted(series,key=lambda item:(item[0],sorted(item[1].items())))
+
+    def refresh(self,method,**params):
+
+        '''Adds a series to the store, or brings a stored series up to date. method is the name of a data method
+        (e.g. 'getNipa') and params are its arguments other than Year. Returns the newly downloaded data. A series
+        has one frequency and is kept as the wide frame of values alone: a Frequency listing several, or an output,
+        codes or seriesKey other than the defaults, raises ValidationError before anything is requested.'''
 
-        uri = 'http://bea.gov/api/data/?UserID='+self.apiKey+'&method=GetData&datasetname=regionalProduct&Component='+str(Component)+'&IndustryId='+str(IndustryId)+'&Year='+str(Year)+'&GeoFips='+str(GeoFips)+'&ResultFormat=JSON&'
-        r = requests.get(uri)
-        rJson = r.json()
+        if mixedFrequency(params.get('Frequency','A')):
+            raise ValidationError('The store keeps one frequency per series; refresh each of '+str(joinList(params['Frequency']))+' separately.',None,'Frequency',params['Frequency'])
+        for option, default in [('output','wide'),('codes',False),('seriesKey','description')]:
+            if params.get(option,default)!=default:
+                raise ValidationError('The store keeps the wide frame of values only; refresh without '+option+'='+repr(params[option])+'.',None,option,params[option])
+        result = self.client.fetch(method,**self._request(method,params))
+        self._write(method,params,result)
+        return result
 
-        columnNames = []
-        dates = []
-        Frequency = 'A'
+    def refreshAll(self,method=None,maxWorkers=8,processes=None):
+
+        '''Refreshes every stored series, or those of one data method, over a pool of threads with getMany(), parsing
+        the responses in worker processes if processes is given. Returns a dict mapping (method, params) keys to the downloaded data, or to {'error':exception} for series
+        that could not be refreshed.'''
+
+        specs = {}
+        for seriesMethod, params in self.series():
+            if method is None or seriesMethod==method:
+                specs[specKey(dict(params,method=seriesMethod))] = (seriesMethod,params)
+
+        toFetch = {key:dict(self._request(seriesMethod,params),method=seriesMethod) for key,(seriesMethod,params) in specs.items()}
+        results = self.client.getMany(toFetch,maxWorkers=maxWorkers,processes=processes)
+        for key,result in results.items():
+            if 'error' not in result:
+                self._write(specs[key][0],specs[key][1],result)
+        return results
+
+    def load(self,method,**params):
+
+        '''Reads a stored series without calling the API. Returns the output of the data method, as of the last
+        refresh.'''
+
+        directory = self._directory(method,params)
+        if not os.path.isfile(os.path.join(directory,'meta.json')):
+            raise KeyError('Series not in store: '+method+' '+str(params))
+        with open(os.path.join(directory,'meta.json')) as metaFile:
+            meta = json.load(metaFile)
+
+        parts = []
+        for year in self._years(directory):
+            fileName = os.path.join(directory,'year='+str(year)+'.parquet')
+            parts.append(pyarrow.parquet.read_table(fileName,memory_map=True).to_pandas())
+        frame = pd.concat(parts).sort_index() if len(parts)>0 else pd.DataFrame()
+
+        result = dict(meta['notes'])
+        result[meta['frameKey']] = frame
+        return result
+
+
+# Instrumentation
+
+# The CallMetrics of the data method call running in the current thread or task, if it is observed
+currentCall = contextvars.ContextVar('currentCall',default=None)
+
+
+class CallMetrics:
+
+    '''Metrics of one data method call, collected while it runs and passed to the observers of the client as the
+    dict event when it ends. Requests sent for the call from other threads or tasks (chunks of a split request) add
+    to the same counters. The keys of event are:
+
+    method          name of the data method, e.g. 'getRegionalIncome'
+    dataset         dataset requested
+    params          request parameters, other than UserID
+    requests        requests sent to the API (more than one for split requests)
+    cacheHits       responses served from the cache
+    cacheMisses     responses looked up in the cache and not found
+    notModified     expired cached responses renewed by a conditional request (304 Not Modified)
+    frameHits       results served from the frame cache (see FrameCache), with no request or parsing
+    retries         requests retried after an error or a throttled (429) response
+    bytes           bytes of the responses received from the API
+    httpSeconds     time spent waiting for and downloading responses, summed over requests
+    decodeSeconds   time spent decoding JSON, summed over responses
+    parseSeconds    time spent building the frame (value conversion and pivoting)
+    records         data records in the response
+    seconds         wall time of the whole call
+    error           the exception raised by the call, or None
+    '''
+
+    counters = ['requests','frameHits','cacheHits','cacheMisses','notModified','retries','bytes','httpSeconds','decodeSeconds','parseSeconds','records']
+
+    def __init__(self,method,params):
+
+        self.lock = threading.Lock()
+        self.start = time.perf_counter()
+        self.event = {'method':method,'dataset':requestDataset(params),'params':dict(params)}
+        self.event.update(dict.fromkeys(self.counters,0))
+        self.event.update(seconds=0.0,error=None)
+
+    def add(self,**counts):
+
+        with self.lock:
+            for key,value in counts.items():
+                self.event[key] += value
+
+    def parse(self,rJson,parse):
+
+        '''Applies parse to the response with parseData(), recording the time it takes and the records parsed.'''
+
+        if not isError(rJson):
+            self.add(records=len(dataContainer(rJson).get('Data',[])))
+        start = time.perf_counter()
         try:
-            for element in rJson['BEAAPI']['Results']['Data']:
-                if element['GeoName'] not in columnNames:
-                    columnNames.append(element['GeoName'])
-
-                date = convertDate(element['TimePeriod'],Frequency)
-                if date not in dates:
-                    dates.append(date)
-
-            data = np.zeros([len(dates),len(columnNames)])
-            data[:] = np.nan
-            frame = pd.DataFrame(data,columns = columnNames, index = dates)
-
-            for element in rJson['BEAAPI']['Results']['Data']:
-                date = convertDate(element['TimePeriod'],Frequency)
-                if len(element['DataValue'].replace(',','')) ==0:
-                    frame.loc[date,element['GeoName']] = np.nan
-                else:
-                    frame.loc[date,element['GeoName']] = float(element['DataValue'].replace(',',''))
-            
-            frame = frame.sort_index()
-            note = rJson['BEAAPI']['Results']['Data'][0]['CL_UNIT']
+            return parseData(rJson,parse)
+        finally:
+            self.add(parseSeconds=time.perf_counter()-start)
+
+    def finish(self):
+
+        self.event['seconds'] = time.perf_counter()-self.start
+
+
+class NullMetrics:
+
+    '''Stand-in for CallMetrics when a call is not observed.'''
+
+    @staticmethod
+    def add(**counts):
+        pass
+
+    @staticmethod
+    def parse(rJson,parse):
+        return parseData(rJson,parse)
+
+
+def recordMetrics(**counts):
+
+    '''Function adding counts to the metrics of the current data method call, if it is observed.'''
+
+    metrics = currentCall.get()
+    if metrics is not None:
+        metrics.add(**counts)
+
+
+def decodeJson(body,decode=json.loads):
+
+    '''Function decoding a response body with decode, recording the time taken if the current call is observed.
+    Raises BeaError if the body is not valid JSON.'''
+
+    metrics = currentCall.get()
+    start = time.perf_counter()
+    try:
+        rJson = decode(body)
+    except ValueError as e:
+        raise BeaError('The API sent a response that is not valid JSON: '+str(e)) from e
+    if metrics is not None:
+        metrics.add(decodeSeconds=time.perf_counter()-start)
+    return rJson
+
+
+def recordResponse(r,start=None,streamed=False):
+
+    '''Function adding a response of the requests session to the metrics of the current data method call, if it is
+    observed: the request, its retries and, given the time it was sent, its bytes and latency.'''
+
+    metrics = currentCall.get()
+    if metrics is None:
+        return
+    retries = getattr(r.raw,'retries',None)
+    metrics.add(retries=0 if retries is None else len(retries.history))
+    if start is not None:
+        size = r.raw.tell() if streamed else len(r.content)
+        metrics.add(requests=1,httpSeconds=time.perf_counter()-start,bytes=size)
+
+
+class MetricsAggregator:
+
+    '''Observer adding up the metrics of data method calls by dataset. Pass an instance in the observers of
+    initialize (or to addObserver()), then call summary() for a table of the totals or counters() for the raw counts,
+    e.g. to export them to a monitoring system.'''
+
+    def __init__(self):
+
+        self.lock = threading.Lock()
+        self.totals = {}
+
+    def __call__(self,event):
+
+        with self.lock:
+            totals = self.totals.setdefault(event['dataset'],dict.fromkeys(['calls','errors']+CallMetrics.counters+['seconds'],0))
+            totals['calls'] += 1
+            totals['errors'] += event['error'] is not None
+            for key in CallMetrics.counters+['seconds']:
+                totals[key] += event[key]
+
+    def counters(self):
+
+        '''Returns the totals as a dict mapping each dataset to a dict of counters.'''
+
+        with self.lock:
+            return {dataset:dict(totals) for dataset,totals in self.totals.items()}
+
+    def reset(self):
+
+        with self.lock:
+            self.totals = {}
+
+    def summary(self):
+
+        '''Prints and returns a DataFrame of the totals with one row per dataset, along with records parsed per second
+        of parsing and the share of responses served from the cache.'''
+
+        frame = pd.DataFrame.from_dict(self.counters(),orient='index')
+        if len(frame)>0:
+            frame['recordsPerSecond'] = frame['records']/frame['parseSeconds'].where(frame['parseSeconds']>0)
+            frame['cacheHitRate'] = frame['cacheHits']/(frame['cacheHits']+frame['cacheMisses']).where(frame['cacheHits']+frame['cacheMisses']>0)
+        print(frame.to_string())
+        return frame
+
+
+# Parsing in worker processes (see initialize.getMany)
+
+@contextlib.contextmanager
+def processPool(processes):
+
+    '''Context manager yielding a pool of worker processes for getMany(processes=...): None if processes is None or
+    False, the executor itself if processes is one (it is left open), or else a new ProcessPoolExecutor with that
+    many processes (True: one per core), shut down on exit. New pools start their workers from a fork server where
+    available, since forking a process that runs request threads is unsafe.'''
+
+    if processes is None or processes is False:
+        yield None
+        return
+    if isinstance(processes,concurrent.futures.Executor):
+        yield processes
+        return
+
+    import multiprocessing
+
+    method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+    pool = concurrent.futures.ProcessPoolExecutor(max_workers=None if processes is True else processes,mp_context=multiprocessing.get_context(method))
+    try:
+        yield pool
+    finally:
+        pool.shutdown()
+
+
+class ArrowFrame:
+
+    '''DataFrame serialized as an Arrow IPC stream, as returned by worker processes. Unpickling the bytes of the
+    stream is a plain copy, unlike unpickling the objects of a frame, and toPandas() rebuilds the frame. Periods, which
+    Arrow does not keep, are sent as timestamps and converted back, with the frequency of each kept in periods (None
+    for the index).'''
+
+    __slots__ = ['data','periods']
+
+    def __init__(self,frame):
+
+        self.periods = {}
+        if isinstance(frame.index,pd.PeriodIndex):
+            self.periods[None] = frame.index.freqstr
+            frame = frame.set_axis(frame.index.to_timestamp(),axis=0)
+        for column in frame.columns:
+            if isinstance(frame[column].dtype,pd.PeriodDtype):
+                self.periods[column] = frame[column].array.freqstr
+                frame = frame.assign(**{column:frame[column].dt.to_timestamp()})
+
+        table = pyarrow.Table.from_pandas(frame,preserve_index=True)
+        sink = pyarrow.BufferOutputStream()
+        with pyarrow.ipc.new_stream(sink,table.schema) as writer:
+            writer.write_table(table)
+        self.data = sink.getvalue().to_pybytes()
+
+    def toPandas(self):
+
+        frame = pyarrow.ipc.open_stream(self.data).read_pandas()
+        for column, freq in self.periods.items():
+            if column is None:
+                frame.index = frame.index.to_period(freq)
+            else:
+                frame[column] = frame[column].dt.to_period(freq)
+        return frame
+
+
+def packFrames(result):
+
+    '''Function replacing the DataFrames of a data method result with ArrowFrames, when pyarrow is installed. Sparse
+    frames, which Arrow cannot hold, are left to be pickled.'''
+
+    if optionalImport('pyarrow.ipc') is None:
+        return result
+    def pack(frame):
+        if any(isinstance(dtype,pd.SparseDtype) for dtype in frame.dtypes):
+            return frame
+        return ArrowFrame(frame)
+    return mapFrames(result,pack)
+
+
+def unpackFrames(result):
 
-            return {'note':note,'date':frame}
+    '''Function undoing packFrames().'''
 
-        except:
+    return mapFrames(result,ArrowFrame.toPandas,ArrowFrame)
 
-                print('Error: invalid input.')
 
+def mapFrames(result,function,types=None):
 
-# Auxiliary function.
+    '''Function returning a data method result with function applied to each of its frames, including the frames by
+    frequency of mixed-frequency results. types are the frame types, DataFrame by default.'''
+
+    types = pd.DataFrame if types is None else types
+
+    def apply(value):
+        if isinstance(value,types):
+            return function(value)
+        if isinstance(value,dict) and any(isinstance(item,types) for item in value.values()):
+            return {key:apply(item) for key,item in value.items()}
+        return value
+
+    return {key:apply(value) for key,value in result.items()}
+
+
+def parseBody(body,parse):
+
+    '''Function run in worker processes: decodes a raw response and applies a data method's parser to it with
+    parseData(). Returns the result packed with packFrames(), the number of data records and the seconds spent
+    decoding and parsing. The result is None if the API rejected the request as too large.'''
+
+    start = time.perf_counter()
+    rJson = decodeJson(body)
+    decoded = time.perf_counter()
+    if isSizeError(rJson):
+        return None, 0, decoded-start, 0.0
+    records = 0 if isError(rJson) else len(dataContainer(rJson).get('Data',[]))
+    result = packFrames(parseData(rJson,parse))
+    return result, records, decoded-start, time.perf_counter()-decoded
+
+
+# Rate limiting
+
+class RateLimiter:
+
+    '''Thread-safe sliding window limit of maxRequests requests per period seconds. wait() blocks the calling thread;
+    asynchronous callers use acquire() and sleep on the returned delay themselves.'''
+
+    def __init__(self,maxRequests,period=60):
+
+        self.maxRequests = maxRequests
+        self.period = period
+        self._times = collections.deque()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+
+        '''Records a request and returns 0 if one is allowed now. Otherwise returns the seconds to wait before trying
+        again.'''
+
+        with self._lock:
+            now = time.monotonic()
+            while self._times and now-self._times[0]>=self.period:
+                self._times.popleft()
+            if len(self._times)<self.maxRequests:
+                self._times.append(now)
+                return 0
+            return self.period-(now-self._times[0])
+
+    def wait(self):
+
+        '''Blocks until another request is allowed and records it.'''
+
+        delay = self.acquire()
+        while delay>0:
+            time.sleep(delay)
+            delay = self.acquire()
+
+
+# Rate limiters shared by every initialize instance with the same API key
+_rateLimiters = {}
+_rateLimitersLock = threading.Lock()
+
+def getRateLimiter(apiKey,maxRequests,period=60):
+
+    '''Function returning the RateLimiter for an API key, creating it if needed. The key's limit is the strictest
+    asked for: a lower maxRequests than the existing limiter's lowers it for every instance using the key, a higher
+    one is ignored.'''
+
+    with _rateLimitersLock:
+        if apiKey not in _rateLimiters:
+            _rateLimiters[apiKey] = RateLimiter(maxRequests,period)
+        limiter = _rateLimiters[apiKey]
+        with limiter._lock:
+            if maxRequests/period<limiter.maxRequests/limiter.period:
+                limiter.maxRequests = maxRequests
+                limiter.period = period
+        return limiter
+
+
+# Streaming responses
+
+class Records(collections.abc.Sequence):
+
+    '''List-like store of BEA data records kept column by column, as built by streamJson(). Indexing or iterating
+    returns records as dicts, and column(key) returns a whole column as a list. Repeated strings other than DataValue
+    are stored once, so memory grows with the number of records rather than with the size of their text.'''
+
+    def __init__(self):
+
+        self.columns = {}
+        self._length = 0
+        self._strings = {}
+
+    def extend(self,records):
+
+        for record in records:
+            self.append(record)
+
+    def append(self,record):
+
+        for key in record:
+            if key not in self.columns:
+                self.columns[key] = [None]*self._length
+        for key,column in self.columns.items():
+            value = record.get(key)
+            if key!='DataValue' and isinstance(value,str):
+                value = self._strings.setdefault(value,value)
+            column.append(value)
+        self._length+=1
+
+    def column(self,key,default=None):
+
+        '''Returns the values of key for every record, with default where a record has no such key.'''
+
+        if self._length==0:
+            return []
+        column = self.columns[key]
+        if default is None:
+            return column
+        return [default if value is None else value for value in column]
+
+    def __len__(self):
+        return self._length
+
+    def __getitem__(self,i):
+
+        if isinstance(i,slice):
+            return [self[j] for j in range(*i.indices(self._length))]
+        if i<0:
+            i+=self._length
+        if not 0<=i<self._length:
+            raise IndexError('record index out of range')
+        return {key:column[i] for key,column in self.columns.items() if column[i] is not None}
+
+
+# Errors
+
+class BeaError(Exception):
+
+    '''Raised when a request to the BEA API fails or its response cannot be parsed.'''
+
+
+class ValidationError(BeaError):
+
+    '''Raised before any request is sent when the parameters of a request cannot be valid. The dataset, parameter
+    and offending value are kept as attributes.'''
+
+    def __init__(self,message,dataset=None,parameter=None,value=None):
+
+        BeaError.__init__(self,message)
+        self.dataset = dataset
+        self.parameter = parameter
+        self.value = value
+
+
+# Auxiliary functions.
 
         
 def convertDate(dateString,Frequency):
 
-    '''Function for converting the date strings from BEA with quarter indicators into datetime format'''
-
-    if Frequency=='A':
-        month='01'
-    elif Frequency=='Q':
-        if dateString[-1]=='1':
-            month='01'
-        elif dateString[-1]=='2':
-            month='04'
-        elif dateString[-1]=='3':
-            month='07'
+    '''Function for converting the date strings from BEA with quarter or month indicators (e.g. 2015, 2015Q3, 2015M07)
+    into datetime format'''
+
+    if Frequency=='Q':
+        month = {'1':1,'2':4,'3':7}.get(dateString[-1],10)
+    elif Frequency=='M':
+        month = int(dateString[-2:])
+    else:
+        month = 1
+    return datetime.datetime(int(dateString[0:4]),month,1)
+
+
+# Cache of date strings already converted by convertDates(), keyed by (dateString, Frequency)
+_dateCache = {}
+
+def convertDates(dateStrings,Frequency):
+
+    '''Function for converting a whole column of BEA date strings into a DatetimeIndex in one call. Duplicate strings
+    are found by hashing and each distinct string is converted only once; conversions are remembered across calls.'''
+
+    codes, uniqueStrings = pd.factorize(np.array(dateStrings,dtype=object))
+
+    uniqueDates = []
+    for dateString in uniqueStrings:
+        date = _dateCache.get((dateString,Frequency))
+        if date is None:
+            date = convertDate(dateString,Frequency)
+            _dateCache[(dateString,Frequency)] = date
+        uniqueDates.append(date)
+
+    return pd.DatetimeIndex(uniqueDates).take(codes)
+
+
+def frameResult(result,key,frame):
+
+    '''Function adding the frame made by buildFrame() to the result dict of a parser under key, along with the frame of
+    suppression codes under 'codes' if buildFrame() returned one.'''
+
+    if isinstance(frame,tuple):
+        result[key], result['codes'] = frame
+    else:
+        result[key] = frame
+    return result
+
+
+# Record fields kept in the 'series' table of results keyed by series codes, with their names in the table
+lineFields = {'LineNumber':'LineNumber','LineDescription':'description','METRIC_NAME':'metric','CL_UNIT':'units','UNIT_MULT':'multiplier'}
+industryFields = {'IndustrYDescription':'description'}
+geoFields = {'GeoName':'description','CL_UNIT':'units','UNIT_MULT':'multiplier'}
+itaFields = {'CL_UNIT':'units','UNIT_MULT':'multiplier'}
+iipFields = {'TimeSeriesDescription':'description','CL_UNIT':'units','UNIT_MULT':'multiplier'}
+
+
+def seriesTable(records,keys,fields):
+
+    '''Function returning the metadata of the series in the data records: one row per distinct combination of the
+    record keys in keys (the column levels of a frame keyed by codes), indexed by them, with the fields of its first
+    record named as in fields (a dict of record field: column name). Fields absent from the records are left out.
+    The 'multiplier' column (UNIT_MULT) is numeric.'''
+
+    keys = list(keys)
+    if isinstance(records,Records):
+        keyColumns = {key:records.column(key) for key in keys}
+    else:
+        keyColumns = {key:[element[key] for element in records] for key in keys}
+    rows = np.flatnonzero(~pd.DataFrame(keyColumns).duplicated().to_numpy())
+
+    table = {key:[column[i] for i in rows] for key,column in keyColumns.items()}
+    for field,name in fields.items():
+        column = [records[i].get(field) for i in rows]
+        if any(value is not None for value in column):
+            table[name] = column
+    table = pd.DataFrame(table).set_index(keys)
+    if 'multiplier' in table.columns:
+        table['multiplier'] = pd.to_numeric(table['multiplier'],errors='coerce')
+    return table
+
+
+def seriesResult(result,records,seriesKey,keys,fields):
+
+    '''Function adding the 'series' table of seriesTable() to the result dict of a parser if its frame is keyed by
+    series codes (seriesKey='code').'''
+
+    if seriesKey=='code':
+        result['series'] = seriesTable(records,keys,fields)
+    return result
+
+
+def splitString(origString, maxLength):
+
+    '''Function splitting a string into lines of fewer than maxLength characters at spaces.'''
+
+    splitLines = []
+    line = ''
+    for word in origString.split(' '):
+        if len(line)+1+len(word)<maxLength:
+            line = line+word+' '
+        else:
+            splitLines.append(line)
+            line = word+' '
+    if len(line) != 0:
+        splitLines.append(line)
+
+    return splitLines
+
+
+def inflate(data,chunkSize=65536):
+
+    '''Generator decompressing zlib compressed bytes chunk by chunk.'''
+
+    decompressor = zlib.decompressobj()
+    for i in range(0,len(data),chunkSize):
+        yield decompressor.decompress(data[i:i+chunkSize])
+    yield decompressor.flush()
+
+
+def streamJson(chunks,key='Data'):
+
+    '''Function decoding a JSON response from an iterable of byte chunks without building the whole document. The
+    first array found under key (the BEA data records) is decoded one record at a time into a Records object;
+    the rest of the document, which is small, is decoded normally. Returns the decoded document with the Records
+    object in place of the array.'''
+
+    textDecoder = codecs.getincrementaldecoder('utf-8')()
+    decoder = json.JSONDecoder()
+    start = re.compile(r'"'+re.escape(key)+r'"\s*:\s*\[')
+    whitespace = re.compile(r'[\s,]*')
+    chunks = iter(chunks)
+
+    def read():
+        for chunk in chunks:
+            if chunk:
+                return textDecoder.decode(chunk)
+        return None
+
+    # Find the start of the array, keeping the text before it
+    head = []
+    buffer = ''
+    while True:
+        match = start.search(buffer)
+        if match is not None:
+            head.append(buffer[:match.end()-1])
+            buffer = buffer[match.end():]
+            break
+        text = read()
+        if text is None:
+            return json.loads(''.join(head)+buffer)
+        keep = max(0,len(buffer)-len(key)-64)
+        head.append(buffer[:keep])
+        buffer = buffer[keep:]+text
+
+    # Decode the records one by one
+    records = Records()
+    position = 0
+    while True:
+        position = whitespace.match(buffer,position).end()
+        if position<len(buffer) and buffer[position]==']':
+            buffer = buffer[position:]
+            break
+        try:
+            if position==len(buffer):
+                raise ValueError
+            record, position = decoder.raw_decode(buffer,position)
+            records.append(record)
+        except ValueError:
+            text = read()
+            if text is None:
+                raise ValueError('Incomplete JSON response')
+            buffer = buffer[position:]+text
+            position = 0
+
+    # Decode the rest of the document with an empty array in place of the records
+    tail = [buffer]
+    text = read()
+    while text is not None:
+        tail.append(text)
+        text = read()
+    document = json.loads(''.join(head)+'['+''.join(tail))
+
+    def replace(node):
+        if isinstance(node,dict):
+            if isinstance(node.get(key),list) and len(node[key])==0:
+                node[key] = records
+                return True
+            return any(replace(value) for value in node.values())
+        if isinstance(node,list):
+            return any(replace(value) for value in node)
+        return False
+
+    replace(document)
+    return document
+
+
+def buildFrame(records,columnKey,dateKey,Frequency,output='wide',dtype='float64',codes=False,labels=(),levels=()):
+
+    '''Function for turning the list of data records returned by the BEA API into a DataFrame. The records are
+    collected into arrays in a single pass. output selects the layout:
+
+        'wide'      one column for each distinct value of columnKey and one row for each date (see pivotColumns)
+        'sparse'    the wide layout with a sparse dtype, for tables with many mostly empty columns
+        'long'      one row per record with a 'date' column, categorical columns for columnKey and for each of the
+                    label keys present in the records, and a 'value' column
+
+    Frequency may list several frequencies, e.g. 'A,Q,M'; the result is then a dict of frames by frequency, each
+    indexed by periods (a PeriodIndex, or periods in the 'date' column of the long layout) rather than dates.
+
+    dtype is the dtype of the values, e.g. 'float32' to halve their memory. levels are keys of the records added as
+    outer column levels in front of columnKey, giving MultiIndex columns in the wide layouts. Values are converted
+    with convertValues(). If codes is True, the suppression codes are returned too: as a 'code' column of the long
+    frame, or for the wide layouts as a second frame of the same shape, in a (frame, codes) tuple.'''
+
+    levels = list(levels)
+    keys = [key for key in levels+list(labels) if key!=columnKey] if output=='long' else []
+    keys = list(dict.fromkeys(keys))
+
+    if isinstance(records,Records):
+        columns = records.column(columnKey)
+        periods = records.column(dateKey)
+        values = records.column('DataValue','')
+        outer = [records.column(key) for key in levels]
+        extra = {key:records.column(key) for key in keys if key in records.columns}
+    else:
+        columns = []
+        periods = []
+        values = []
+        outer = [[] for key in levels]
+        extra = {key:[] for key in keys}
+        for element in records:
+            columns.append(element[columnKey])
+            periods.append(element[dateKey])
+            values.append(element.get('DataValue',''))
+            for key,column in zip(levels,outer):
+                column.append(element[key])
+            for key,column in extra.items():
+                column.append(element.get(key))
+        extra = {key:column for key,column in extra.items() if any(value is not None for value in column)}
+
+    if codes:
+        values, valueCodes = convertValues(values,dtype,codes=True)
+    else:
+        values, valueCodes = convertValues(values,dtype), None
+
+    # Seasonal variants such as QSA and QNSA are dated like their frequency, from its first letter
+    frequencies = list(dict.fromkeys(f.strip().upper()[:1] for f in str(Frequency).split(',')))
+    if len(frequencies)==1:
+        dates = convertDates(periods,frequencies[0])
+        return assembleFrame(dates,columns,values,valueCodes,outer,extra,columnKey,keys,levels,output,dtype)
+
+    # Several frequencies in one response: split the records by the form of their date strings, and give each
+    # frequency its own frame with a PeriodIndex
+    kinds = periodFrequencies(periods)
+    columns, periods = np.asarray(columns,dtype=object), np.asarray(periods,dtype=object)
+    outer = [np.asarray(column,dtype=object) for column in outer]
+    extra = {key:np.asarray(column,dtype=object) for key,column in extra.items()}
+    frames, codeFrames = {}, {}
+    for f in frequencies:
+        rows = np.flatnonzero(kinds==f)
+        dates = convertDates(periods[rows],f)
+        frame = assembleFrame(dates,columns[rows],values[rows],None if valueCodes is None else valueCodes[rows],
+                              [column[rows] for column in outer],{key:column[rows] for key,column in extra.items()},
+                              columnKey,keys,levels,output,dtype)
+        if codes and output!='long':
+            frame, codeFrames[f] = frame[0], toPeriods(frame[1],f)
+        frames[f] = toPeriods(frame,f)
+    if codes and output!='long':
+        return frames, codeFrames
+    return frames
+
+
+def assembleFrame(dates,columns,values,valueCodes,outer,extra,columnKey,keys,levels,output,dtype):
+
+    '''Function building the frame of buildFrame() from the arrays collected from the records, with converted dates
+    and values. Returns (frame, codes) if valueCodes is given and the layout is wide.'''
+
+    if output=='long':
+        frame = {'date':dates,columnKey:pd.Categorical(columns)}
+        for key in keys:
+            if key in extra:
+                frame[key] = pd.Categorical(extra[key])
+        frame['value'] = values
+        if valueCodes is not None:
+            frame['code'] = pd.Categorical(valueCodes)
+        frame = pd.DataFrame(frame)
+        return frame.sort_values('date',kind='stable').reset_index(drop=True)
+
+    if len(levels)>0:
+        pivot = functools.partial(pivotColumns,dates,outer+[columns],names=levels+[columnKey])
+    else:
+        pivot = functools.partial(pivotColumns,dates,columns)
+    frame = pivot(values)
+    if output=='sparse':
+        frame = frame.astype(pd.SparseDtype(frame.dtypes.iloc[0] if frame.shape[1]>0 else dtype,np.nan))
+    if valueCodes is not None:
+        return frame, pivot(valueCodes)
+    return frame
+
+
+# pandas period frequencies of the BEA frequency codes
+periodFrequency = {'A':'Y','Q':'Q','M':'M'}
+
+
+def periodFrequencies(periods):
+
+    '''Function returning an array with the frequency (A, Q or M) of each BEA date string, judged by its form (2015,
+    2015Q3, 2015M07). Each distinct string is examined once.'''
+
+    codes, uniqueStrings = pd.factorize(np.asarray(periods,dtype=object))
+    kinds = np.array(['M' if 'M' in str(period) else 'Q' if 'Q' in str(period) else 'A' for period in uniqueStrings]+['A'])
+    return kinds[codes]
+
+
+def toPeriods(frame,Frequency):
+
+    '''Function replacing the dates of a frame made by assembleFrame() (its index, or its 'date' column in the long
+    layout) by periods of the given frequency.'''
+
+    if 'date' in frame.columns and not isinstance(frame.index,pd.DatetimeIndex):
+        frame['date'] = frame['date'].dt.to_period(periodFrequency[Frequency])
+    else:
+        frame.index = frame.index.to_period(periodFrequency[Frequency])
+    return frame
+
+
+def convertValues(values,dtype='float64',codes=False):
+
+    '''Function converting a sequence of DataValue strings to an array of numbers in one pass of the C parser of
+    pandas. Thousands separators are removed, and empty strings, suppression codes such as (D) or (NA) and any other
+    non-numeric markers become NaN, so no single value can fail the conversion of a table. If codes is True, also
+    returns an object array holding the marker sent in place of each NaN value, and None elsewhere.'''
+
+    values = values if isinstance(values,list) else list(values)
+    numbers = None
+    if len(values)>0 and not any('\n' in value or '\r' in value for value in values):
+        # A final sentinel line stops read_csv from dropping trailing empty values
+        column = pd.read_csv(io.StringIO('\n'.join(values)+'\n0'),header=None,names=['value'],sep='\x1f',thousands=',',
+                             skip_blank_lines=False,quoting=csv.QUOTE_NONE,na_values=suppressionCodes+[''],keep_default_na=False)['value']
+        if len(column)==len(values)+1 and pd.api.types.is_numeric_dtype(column.dtype):
+            numbers = column.to_numpy(dtype=dtype,na_value=np.nan)[:-1]
+    if numbers is None:
+        # Markers outside suppressionCodes: coerce whatever is not a number
+        cleaned = pd.Series(values,dtype=object).str.replace(',','',regex=False).str.strip()
+        numbers = pd.to_numeric(cleaned,errors='coerce').to_numpy(dtype=dtype,na_value=np.nan)
+
+    if not codes:
+        return numbers
+
+    valueCodes = np.full(len(values),None,dtype=object)
+    for i in np.flatnonzero(np.isnan(numbers)):
+        code = values[i].strip()
+        if len(code)>0:
+            valueCodes[i] = code
+    return numbers, valueCodes
+
+
+def pivotColumns(dates,columns,values,names=None):
+
+    '''Function for pivoting parallel arrays of dates, column labels and values into a DataFrame with one column for
+    each distinct label and one row for each date, filled with one vectorized assignment. Columns appear in the order
+    first seen, the index is sorted, and where a (date, column) pair is repeated the last value wins. If names is
+    given, columns is a list of label arrays, one per level of MultiIndex columns with those names.'''
+
+    values = np.asarray(values)
+    if names is None:
+        columnCodes, columnNames = pd.factorize(np.array(columns,dtype=object))
+        columnNames = pd.Index(columnNames)
+    else:
+        columnCodes, columnNames = pd.MultiIndex.from_arrays([np.array(level,dtype=object) for level in columns]).factorize()
+        columnNames = columnNames.set_names(names)
+    dateCodes, dates = pd.factorize(pd.DatetimeIndex(dates),sort=True)
+
+    # Keep only the last record for each (date, column) cell
+    cells = dateCodes*len(columnNames)+columnCodes
+    unique, lastReversed = np.unique(cells[::-1],return_index=True)
+    last = len(cells)-1-lastReversed
+
+    if values.dtype.kind=='O':
+        data = np.full([len(dates),len(columnNames)],None,dtype=object)
+    else:
+        data = np.full([len(dates),len(columnNames)],np.nan,dtype=values.dtype if values.dtype.kind=='f' else float)
+    data[dateCodes[last],columnCodes[last]] = values[last]
+
+    return pd.DataFrame(data,index=pd.DatetimeIndex(dates),columns=columnNames)
+
+
+def longToWide(frame,columns,sparse=False):
+
+    '''Function converting a frame returned with output='long' to the wide layout, with one column for each value of
+    the column named by columns (e.g. 'GeoFips' or 'GeoName'). Set sparse to True for a sparse dtype.'''
+
+    wide = pivotColumns(frame['date'],frame[columns],frame['value'].to_numpy())
+    if sparse:
+        wide = wide.astype(pd.SparseDtype(wide.dtypes.iloc[0] if wide.shape[1]>0 else float,np.nan))
+    return wide
+
+
+def requestDataset(params):
+
+    '''Function returning the lower case dataset name of a request, or the method name for requests without one.'''
+
+    for key,value in params.items():
+        if key.lower()=='datasetname':
+            return str(value).lower()
+    for key,value in params.items():
+        if key.lower()=='method':
+            return str(value).lower()
+    return ''
+
+
+def requestKey(params):
+
+    '''Function returning a canonical key for a set of request parameters. Parameter names and values are compared
+    without regard to case or order, and UserID and ResultFormat are ignored.'''
+
+    canonical = sorted((str(key).lower(),str(value).upper()) for key,value in params.items() if str(key).lower() not in ('userid','resultformat'))
+    return hashlib.sha1(json.dumps(canonical).encode('utf-8')).hexdigest()
+
+
+def frameKey(method,params,parse):
+
+    '''Function returning the FrameCache key of a data method call: the method, the canonical request key of its
+    parameters, and the keyword arguments of its parser (output options, frequency, column levels).'''
+
+    keywords = getattr(parse,'keywords',{})
+    return (method,requestKey(params),repr(sorted((key,str(value).upper()) for key,value in keywords.items())))
+
+
+def seriesCodes(result):
+
+    '''Function returning the codes of the 'series' table of a data method result that name columns of its wide
+    frames, for the series index of FrameCache.'''
+
+    table = result.get('series')
+    data = result['data'] if 'data' in result else result.get('date')
+    if not isinstance(table,pd.DataFrame) or data is None:
+        return []
+    frames = list(data.values()) if isinstance(data,dict) else [data]
+    return [code for code in table.index if any(code in frame.columns for frame in frames)]
+
+
+def copyOnWrite():
+
+    '''Function returning True if pandas copies frames on write, which makes shallow copies safe to hand out.'''
+
+    if int(pd.__version__.split('.')[0])>=3:
+        return True
+    try:
+        return pd.get_option('mode.copy_on_write') is True
+    except KeyError:
+        return False
+
+
+def copyResult(result):
+
+    '''Function returning a copy of a data method result whose frames can be modified without changing result.'''
+
+    deep = not copyOnWrite()
+    return mapFrames(result,lambda frame: frame.copy(deep=deep))
+
+
+def resultBytes(result):
+
+    '''Function returning the memory used by the frames of a data method result, in bytes.'''
+
+    sizes = []
+    mapFrames(result,lambda frame: sizes.append(frame.memory_usage(index=True,deep=True).sum()))
+    return int(sum(sizes))
+
+
+def contentHash(body):
+
+    '''Function returning the content hash of a raw response body, used to tell revised responses from unchanged
+    ones.'''
+
+    return hashlib.sha256(body).hexdigest()
+
+
+def conditionalHeaders(validators):
+
+    '''Function returning the HTTP headers making a request conditional on the ETag and Last-Modified values of
+    a previous response (see ResponseCache.validators).'''
+
+    headers = {}
+    if validators:
+        if validators.get('etag'):
+            headers['If-None-Match'] = validators['etag']
+        if validators.get('lastModified'):
+            headers['If-Modified-Since'] = validators['lastModified']
+    return headers
+
+
+def diff(previous,current,tolerance=0):
+
+    '''Function comparing two results of the same data method call, e.g. before and after a release, and returning
+    the revised cells only. previous and current are wide frames or the dicts returned by the data methods. Returns
+    a DataFrame with a row for each cell whose value changed by more than tolerance, appeared or disappeared: its
+    date, its column label (one column per level for MultiIndex columns), and the 'old' and 'new' values. Series
+    with no revisions do not appear, so list(diff(a,b)[column].unique()) gives the series to recompute. For
+    mixed-frequency results, returns a dict of such frames by frequency.'''
+
+    frames = []
+    for result in [previous,current]:
+        # A dict keyed by A, Q and M holds the frames by frequency of a mixed-frequency result
+        if isinstance(result,dict) and not set(result)<=set(periodFrequency):
+            result = [value for value in result.values() if isinstance(value,pd.DataFrame) or isinstance(value,dict) and
+                      len(value)>0 and set(value)<=set(periodFrequency)][0]
+        frames.append(result)
+    if isinstance(frames[0],dict) or isinstance(frames[1],dict):
+        if not (isinstance(frames[0],dict) and isinstance(frames[1],dict)):
+            raise ValueError('Cannot compare a mixed-frequency result with a single-frequency one.')
+        return {f:diff(frames[0].get(f,pd.DataFrame()),frames[1].get(f,pd.DataFrame()),tolerance) for f in dict.fromkeys(list(frames[0])+list(frames[1]))}
+
+    frames = [frame.sparse.to_dense() if any(isinstance(dtype,pd.SparseDtype) for dtype in frame.dtypes) else frame for frame in frames]
+    old, new = frames[0].align(frames[1],join='outer')
+
+    oldValues = old.to_numpy(dtype=float)
+    newValues = new.to_numpy(dtype=float)
+    bothMissing = np.isnan(oldValues) & np.isnan(newValues)
+    with np.errstate(invalid='ignore'):
+        revised = ~bothMissing & ~(np.abs(newValues-oldValues)<=tolerance)
+    rows, columns = np.nonzero(revised)
+
+    revisions = {'date':old.index[rows]}
+    labels = old.columns[columns]
+    if isinstance(labels,pd.MultiIndex):
+        for level,name in enumerate(labels.names):
+            revisions[name if name is not None else 'level'+str(level)] = labels.get_level_values(level)
+    else:
+        revisions[labels.name if labels.name is not None else 'series'] = labels
+    revisions['old'] = oldValues[rows,columns]
+    revisions['new'] = newValues[rows,columns]
+    return pd.DataFrame(revisions)
+
+
+def isList(value):
+
+    '''Function returning True if a parameter value holds several values.'''
+
+    return isinstance(value,(list,tuple,set))
+
+
+def mixedFrequency(Frequency):
+
+    '''Function returning True if Frequency lists several of the A, Q and M frequencies, for which the data methods
+    return a dict of frames by frequency.'''
+
+    return len(set(f.strip().upper()[:1] for f in str(joinList(Frequency)).split(',')))>1
+
+
+def joinList(value):
+
+    '''Function turning a list of parameter values into the comma separated form accepted by the API.'''
+
+    if isList(value):
+        return ','.join(str(item) for item in value)
+    return value
+
+
+def checkSeriesKey(seriesKey,dataset=None):
+
+    '''Function raising ValidationError unless seriesKey, the option naming the columns of the data methods, is
+    'description' or 'code'.'''
+
+    if seriesKey not in ('description','code'):
+        raise ValidationError('seriesKey must be \'description\' or \'code\'.',dataset,'seriesKey',seriesKey)
+
+
+def splitRequest(params,key,values,size):
+
+    '''Function returning copies of params with the parameter key set to successive chunks of size values.'''
+
+    return [dict(params,**{key:','.join(str(value) for value in values[i:i+size])}) for i in range(0,len(values),size)]
+
+
+def dataContainer(rJson):
+
+    '''Function returning the part of a decoded response that holds the Data records.'''
+
+    if 'Data' in rJson['BEAAPI']:
+        return rJson['BEAAPI']
+    return rJson['BEAAPI']['Results']
+
+
+def mergeResponses(rJsons,chunks):
+
+    '''Function merging the decoded responses to the chunks of a split request into one response with the records
+    of every chunk, in order. Raises BeaError, naming the years and geographies of the chunk, if any chunk failed:
+    the records of the other chunks alone would silently leave out part of the data.'''
+
+    for chunk,rJson in zip(chunks,rJsons):
+        if isError(rJson):
+            raise BeaError(chunkDescription(chunk)+' of a split request failed: '+errorMessage(rJson))
+    if len(rJsons)==1:
+        return rJsons[0]
+
+    containers = [dataContainer(rJson) for rJson in rJsons]
+    if any(isinstance(container['Data'],Records) for container in containers):
+        data = Records()
+        for container in containers:
+            data.extend(container['Data'])
+    else:
+        data = [record for container in containers for record in container['Data']]
+
+    merged = dict(rJsons[0])
+    merged['BEAAPI'] = dict(merged['BEAAPI'])
+    if 'Data' in merged['BEAAPI']:
+        merged['BEAAPI']['Data'] = data
+    else:
+        merged['BEAAPI']['Results'] = dict(merged['BEAAPI']['Results'],Data=data)
+    return merged
+
+
+def chunkDescription(chunk):
+
+    '''Function describing a chunk of a split request by its Year and GeoFips values, e.g. 'chunk Year=2000...2009'.'''
+
+    parts = []
+    for key in ('Year','GeoFips'):
+        if key in chunk:
+            values = str(chunk[key]).split(',')
+            parts.append(key+'='+(values[0] if len(values)==1 else values[0]+'...'+values[-1]))
+    return 'chunk '+', '.join(parts)
+
+
+def isSizeError(rJson):
+
+    '''Function returning True if a decoded response is an error saying the request asks for too much data (see
+    sizeErrorPattern).'''
+
+    if not isError(rJson):
+        return False
+    return sizeErrorPattern.search(errorMessage(rJson)) is not None
+
+
+def statusMessage(status,body):
+
+    '''Function returning the error message for a response with an HTTP error status: the status and the BEA error
+    description of the body, if it has one.'''
+
+    try:
+        rJson = json.loads(body)
+    except ValueError:
+        rJson = None
+    if rJson is not None and isError(rJson) and errorMessage(rJson)!='invalid input.':
+        return 'HTTP '+str(status)+': '+errorMessage(rJson)
+    return 'HTTP '+str(status)+' from the API.'
+
+
+def isError(rJson):
+
+    '''Function returning True if a decoded BEA API response reports an error.'''
+
+    try:
+        return 'Error' in rJson['BEAAPI'] or 'Error' in rJson['BEAAPI'].get('Results',{})
+    except (KeyError,TypeError,AttributeError):
+        return True
+
+
+def parseData(rJson,parse):
+
+    '''Function applying a data method's parser to a decoded response. Raises BeaError if the response reports an
+    error or cannot be parsed.'''
+
+    if isError(rJson):
+        raise BeaError(errorMessage(rJson))
+    try:
+        return parse(rJson)
+    except Exception as e:
+        raise BeaError('invalid input.') from e
+
+
+def retryAfterSeconds(value):
+
+    '''Function converting a Retry-After header (seconds or an HTTP date) to seconds. Returns None if absent.'''
+
+    if value is None:
+        return None
+    try:
+        return max(0,float(value))
+    except ValueError:
+        try:
+            return max(0,email.utils.parsedate_to_datetime(value).timestamp()-time.time())
+        except (TypeError,ValueError):
+            return None
+
+
+def errorMessage(rJson):
+
+    '''Function returning the error description from a decoded BEA API error response.'''
+
+    try:
+        error = rJson['BEAAPI'].get('Error') or rJson['BEAAPI']['Results']['Error']
+        if 'ErrorDetail' in error:
+            return error['ErrorDetail']['Description']
+        return error['APIErrorDescription']
+    except (KeyError,TypeError,AttributeError):
+        return 'invalid input.'
+
+
+def specKey(spec):
+
+    '''Function returning a hashable key for a getMany() request spec.'''
+
+    return tuple(sorted((key,str(value)) for key,value in spec.items()))
+
+
+def unitsNote(units,mult):
+
+    '''Function prefixing a unit of measure with the scale given by a BEA UNIT_MULT value.'''
+
+    if int(mult) == 3:
+        units = 'Thousands of '+units
+    elif int(mult) == 6:
+        units = 'Millions of '+units
+    elif int(mult) == 9:
+        units = 'Billions of '+units
+    return units
+
+
+# Parsers for the decoded responses of the data methods. Each returns the output of the matching get* method.
+
+def parseRegionalData(rJson,levels=(),output='wide',dtype='float64',codes=False,seriesKey='description'):
+
+    records = rJson['BEAAPI']['Results']['Data']
+    columnKey = 'GeoFips' if seriesKey=='code' else 'GeoName'
+    frame = buildFrame(records,columnKey,'TimePeriod','A',output,dtype,codes,('Code','GeoFips','GeoName'),levels)
+    note = rJson['BEAAPI']['Results']['PublicTable']+' - '+rJson['BEAAPI']['Results']['Statistic']+' - '+rJson['BEAAPI']['Results']['UnitOfMeasure']
+
+    return seriesResult(frameResult({'note':note},'data',frame),records,seriesKey,list(levels)+[columnKey],geoFields)
+
+
+def parseNipa(rJson,Frequency='A',levels=(),output='wide',dtype='float64',codes=False,seriesKey='description'):
+
+    records = rJson['BEAAPI']['Results']['Data']
+    columnKey = 'SeriesCode' if seriesKey=='code' else 'LineDescription'
+    frame = buildFrame(records,columnKey,'TimePeriod',Frequency,output,dtype,codes,('SeriesCode','LineNumber','LineDescription'),levels)
+    note = rJson['BEAAPI']['Results']['Notes'][0]['NoteText']
+
+    return seriesResult(frameResult({'note':note},'data',frame),records,seriesKey,list(levels)+[columnKey],lineFields)
+
+
+def parseFixedAssets(rJson,levels=(),output='wide',dtype='float64',codes=False,seriesKey='description'):
+
+    records = rJson['BEAAPI']['Results']['Data']
+    columnKey = 'SeriesCode' if seriesKey=='code' else 'LineDescription'
+    frame = buildFrame(records,columnKey,'TimePeriod','A',output,dtype,codes,('SeriesCode','LineNumber','LineDescription'),levels)
+    note = rJson['BEAAPI']['Results']['Notes'][0]['NoteText']
+
+    return seriesResult(frameResult({'note':note},'data',frame),records,seriesKey,list(levels)+[columnKey],lineFields)
+
+
+def parseGdpByIndustry(rJson,Frequency='A',levels=(),output='wide',dtype='float64',codes=False,seriesKey='description'):
+
+    records = rJson['BEAAPI']['Results']['Data']
+    columnKey = 'Industry' if seriesKey=='code' else 'IndustrYDescription'
+    frame = buildFrame(records,columnKey,'Year',Frequency,output,dtype,codes,('Industry','IndustrYDescription'),levels)
+    note = rJson['BEAAPI']['Results']['Notes'][0]['NoteText']
+
+    return seriesResult(frameResult({'note':note},'data',frame),records,seriesKey,list(levels)+[columnKey],industryFields)
+
+
+def parseIta(rJson,AreaOrCountry='ALL',Frequency='A',levels=(),output='wide',dtype='float64',codes=False,seriesKey='description'):
+
+    # Year holds only the year, so the quarter or month of other frequencies is read from TimePeriod
+    frequencies = [f.strip().upper() for f in str(Frequency).split(',')]
+    records = rJson['BEAAPI']['Results']['Data']
+    dateKey = 'TimePeriod' if frequencies!=['A'] and 'TimePeriod' in records[0] else 'Year'
+    # The series are named by their codes whatever seriesKey is
+    columnKey = 'AreaOrCountry' if AreaOrCountry.lower()=='all' else 'Indicator'
+    frame = buildFrame(records,columnKey,dateKey,Frequency,output,dtype,codes,('Indicator','AreaOrCountry'),levels)
+
+    units = unitsNote(rJson['BEAAPI']['Results']['Data'][0]['CL_UNIT'],rJson['BEAAPI']['Results']['Data'][0]['UNIT_MULT'])
+    if any(f.startswith('Q') for f in frequencies):
+        for note in rJson['BEAAPI']['Results']['Notes']:
+            if note['NoteRef'] == 'Q':
+                units = units + ', '+ note['NoteText']
+
+    return seriesResult(frameResult({'note':units},'data',frame),records,seriesKey,list(levels)+[columnKey],itaFields)
+
+
+def parseIip(rJson,Frequency='A',levels=(),output='wide',dtype='float64',codes=False,seriesKey='description'):
+
+    records = rJson['BEAAPI']['Data']
+    columnKey = 'TimeSeriesId' if seriesKey=='code' else 'TimeSeriesDescription'
+    frame = buildFrame(records,columnKey,'TimePeriod',Frequency,output,dtype,codes,('TypeOfInvestment','Component','TimeSeriesId','TimeSeriesDescription'),levels)
+    units = unitsNote(records[0]['CL_UNIT'],records[0]['UNIT_MULT'])
+
+    return seriesResult(frameResult({'note':units},'date',frame),records,seriesKey,list(levels)+[columnKey],iipFields)
+
+
+def parseRegionalIncome(rJson,levels=(),output='wide',dtype='float64',codes=False,seriesKey='description'):
+
+    records = rJson['BEAAPI']['Results']['Data']
+    columnKey = 'GeoFips' if seriesKey=='code' else 'GeoName'
+    frame = buildFrame(records,columnKey,'TimePeriod','A',output,dtype,codes,('Code','GeoFips','GeoName'),levels)
+    units = rJson['BEAAPI']['Results']['UnitOfMeasure']
+
+    return seriesResult(frameResult({'notes':units},'data',frame),records,seriesKey,list(levels)+[columnKey],geoFields)
+
+
+def parseRegionalProduct(rJson,levels=(),output='wide',dtype='float64',codes=False,seriesKey='description'):
+
+    records = rJson['BEAAPI']['Results']['Data']
+    columnKey = 'GeoFips' if seriesKey=='code' else 'GeoName'
+    frame = buildFrame(records,columnKey,'TimePeriod','A',output,dtype,codes,('Code','GeoFips','GeoName'),levels)
+    note = records[0]['CL_UNIT']
+
+    return seriesResult(frameResult({'note':note},'date',frame),records,seriesKey,list(levels)+[columnKey],geoFields)
+
+
+def parseRegionalPanel(rJson,output='long',dtype='float64',codes=False):
+
+    '''Function assembling the merged responses of a regional panel into a long frame with a (date, GeoFips,
+    LineCode) MultiIndex, or an xarray DataArray for output='array' (see initialize.getRegionalPanel). The records
+    are collected into columns by buildFrame() in one pass; LineCodes are read from the Code of the records
+    (e.g. CAINC1-3).'''
+
+    records = rJson['BEAAPI']['Results']['Data']
+    frame = buildFrame(records,'GeoFips','TimePeriod','A','long',dtype,codes,('Code',))
+    frame['Code'] = frame['Code'].cat.rename_categories(lineCodeOf)
+    frame = frame.rename(columns={'Code':'LineCode'}).set_index(['date','GeoFips','LineCode'])
+    frame = frame[~frame.index.duplicated(keep='last')].sort_index()
+    frame.index = frame.index.remove_unused_levels()
+
+    series = seriesTable(records,['Code'],{'CL_UNIT':'units','UNIT_MULT':'multiplier'})
+    series.index = series.index.map(lineCodeOf).rename('LineCode')
+    result = {'data':frame,'series':series,'geographies':seriesTable(records,['GeoFips'],{'GeoName':'GeoName'})}
+    if output!='array':
+        return result
+
+    # Place the values in a (time, GeoFips, LineCode) array at the positions given by the codes of the index levels
+    xarray = optionalImport('xarray')
+    index = frame.index
+    coords = {'time':np.asarray(index.levels[0]),'GeoFips':np.asarray(index.levels[1],dtype=object),'LineCode':np.asarray(index.levels[2],dtype=object)}
+    shape = tuple(len(level) for level in index.levels)
+    cube = np.full(shape,np.nan,dtype=frame['value'].to_numpy().dtype)
+    cube[tuple(index.codes)] = frame['value'].to_numpy()
+    result['data'] = xarray.DataArray(cube,coords=coords,dims=('time','GeoFips','LineCode'),name='value')
+    if codes:
+        codeCube = np.full(shape,None,dtype=object)
+        codeCube[tuple(index.codes)] = np.where(frame['code'].isna(),None,frame['code'].to_numpy(dtype=object))
+        result['codes'] = xarray.DataArray(codeCube,coords=coords,dims=('time','GeoFips','LineCode'),name='code')
+    return result
+
+
+def lineCodeOf(code):
+
+    '''Function returning the LineCode part of the Code of a regional record (3 for CAINC1-3).'''
+
+    return str(code).rsplit('-',1)[-1]
+
+
+# Command-line exporter: python -m beapy manifest.json
+#
+# The manifest is a JSON (or, with PyYAML installed, YAML) file listing data requests, either as a list or under
+# 'requests' in a dict that may also set defaults for the command-line options (apiKey, baseUrl, output, format,
+# cache, workers, writers, rateLimit, processes). Each request names a data method and its arguments, plus an optional file name:
+#
+#   {"apiKey": "...", "format": "parquet", "output": "exports",
+#    "requests": [{"name": "gdp", "method": "getNipa", "TableID": "T10101", "Frequency": "Q"},
+#                 {"method": "getRegionalIncome", "TableName": "CA1", "LineCode": 1, "GeoFips": "COUNTY"}]}
+#
+# Each result is written to its own file as soon as it arrives. Files are written under a temporary name and
+# renamed when complete, and requests whose file already exists are skipped, so an interrupted export picks up
+# where it left off when run again.
+
+exportFormats = {'parquet':'.parquet','csv':'.csv','feather':'.feather'}
+
+
+def loadManifest(path):
+
+    '''Function reading an export manifest. Returns a dict of options and the list of request specs.'''
+
+    with open(path) as manifestFile:
+        text = manifestFile.read()
+    if path.lower().endswith(('.yaml','.yml')):
+        yaml = optionalImport('yaml')
+        if yaml is None:
+            raise ImportError('YAML manifests require PyYAML.')
+        manifest = yaml.safe_load(text)
+    else:
+        manifest = json.loads(text)
+
+    if isinstance(manifest,list):
+        manifest = {'requests':manifest}
+    options = {key:value for key,value in manifest.items() if key!='requests'}
+    return options, list(manifest.get('requests',[]))
+
+
+def exportName(spec):
+
+    '''Function returning the file name, without extension, under which the result of a request spec is exported.'''
+
+    if spec.get('name'):
+        name = str(spec['name'])
+    else:
+        name = '_'.join([spec['method']]+[key+'-'+str(joinList(value)) for key,value in sorted(spec.items()) if key!='method'])
+    return re.sub(r'[^A-Za-z0-9_.-]+','-',name)
+
+
+def writeFrame(frame,path,format='parquet'):
+
+    '''Function writing the frame of a data method result to path in the given format (parquet, csv or feather). The
+    file is written under a temporary name and renamed, so path only ever holds a complete file.'''
+
+    frame = frame.rename_axis(frame.index.name or 'date')
+    if format in ('parquet','feather') and isinstance(frame.columns,pd.MultiIndex):
+        frame = frame.set_axis([' | '.join(str(level) for level in column) for column in frame.columns],axis=1)
+    if format=='feather':
+        frame = frame.reset_index()
+        frame.columns = [str(column) for column in frame.columns]
+
+    temporary = path+'.tmp'
+    if format=='csv':
+        frame.to_csv(temporary)
+    elif format=='feather':
+        frame.to_feather(temporary)
+    else:
+        frame.to_parquet(temporary)
+    os.replace(temporary,path)
+
+
+def export(client,specs,output='.',format='parquet',workers=8,writers=2,resume=True,stream=None,processes=None):
+
+    '''Function fetching the data for a list of request specs through client and writing each result to a file in
+    the output directory, named by exportName(). Requests run on workers threads and files are written on writers
+    threads. If resume is True, requests whose file already exists are skipped. processes parses responses in worker
+    processes, as in getMany(). Progress is reported on stream (stderr by default). Returns a dict mapping each file name to None, or to the exception if the request failed.
+    Each file holds one frame, so a spec whose Frequency lists several frequencies raises ValidationError before
+    anything is requested.'''
+
+    if stream is None:
+        stream = sys.stderr
+    if format not in exportFormats:
+        raise ValueError('format must be one of '+', '.join(exportFormats))
+    if format in ('parquet','feather') and optionalImport('pyarrow') is None:
+        raise ImportError(format+' export requires pyarrow.')
+    if not os.path.isdir(output):
+        os.makedirs(output)
+
+    jobs = {}
+    for spec in specs:
+        name = exportName(spec)
+        if name in jobs:
+            raise ValueError('Two requests export to the same file: '+name+'. Give them different names.')
+        if mixedFrequency(spec.get('Frequency','A')):
+            raise ValidationError('Request '+name+' lists several frequencies; export each frequency as its own request.',None,'Frequency',spec['Frequency'])
+        jobs[name] = spec
+
+    paths = {name:os.path.join(output,name+exportFormats[format]) for name in jobs}
+    results = {}
+    if resume:
+        for name in jobs:
+            if os.path.isfile(paths[name]):
+                results[name] = None
+        if len(results)>0:
+            stream.write('Skipping '+str(len(results))+' requests already exported.\n')
+    pending = [name for name in jobs if name not in results]
+
+    aggregator = MetricsAggregator()
+    client.addObserver(aggregator)
+    lock = threading.Lock()
+    start = time.perf_counter()
+    done = [0]
+
+    def fetch(name):
+        spec = {key:value for key,value in jobs[name].items() if key not in ('name','method')}
+        if pool is None:
+            return client.fetch(jobs[name]['method'],**spec)
+        return client._fetchDataInPool(pool,jobs[name]['method'],**spec)
+
+    def write(name,result):
+        # Reported as soon as the file is written, so that progress shows while other requests are in flight
+        try:
+            frame = [value for value in result.values() if isinstance(value,pd.DataFrame)][0]
+            writeFrame(frame,paths[name],format)
+        except Exception as e:
+            report(name,e)
         else:
-            month='10'
-    return datetime.datetime.strptime(dateString[0:4]+'-'+month+'-01','%Y-%m-%d')
\ No newline at end of file
+            report(name,None)
+
+    def report(name,error):
+        with lock:
+            results[name] = error
+            done[0] += 1
+            elapsed = time.perf_counter()-start
+            totals = aggregator.counters()
+            records = sum(total['records'] for total in totals.values())
+            received = sum(total['bytes'] for total in totals.values())
+            status = 'ok' if error is None else 'failed: '+str(error)
+            stream.write('[{}/{}] {} {} ({:.1f} requests/min, {:,.0f} records/s, {:.1f} MB received)\n'.format(
+                done[0],len(pending),name,status,60*done[0]/elapsed,records/elapsed,received/2**20))
+            stream.flush()
+
+    try:
+        with processPool(processes) as pool, concurrent.futures.ThreadPoolExecutor(max_workers=writers) as writerPool:
+            with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as fetchPool:
+                fetches = {fetchPool.submit(fetch,name):name for name in pending}
+                for future in concurrent.futures.as_completed(fetches):
+                    name = fetches[future]
+                    try:
+                        writerPool.submit(write,name,future.result())
+                    except Exception as e:
+                        report(name,e)
+    finally:
+        client.removeObserver(aggregator)
+
+    failed = [name for name,error in results.items() if error is not None]
+    stream.write('Exported {} of {} requests in {:.1f} s.'.format(len(jobs)-len(failed),len(jobs),time.perf_counter()-start))
+    stream.write(' '+str(len(failed))+' failed; run again to retry them.\n' if failed else '\n')
+    return {name:results[name] for name in jobs}
+
+
+def main(argv=None):
+
+    '''Entry point of python -m beapy. Returns the exit status: 0 if every request was exported, 1 otherwise.'''
+
+    import argparse
+
+    parser = argparse.ArgumentParser(prog='python -m beapy',description='Export BEA data listed in a manifest to Parquet, CSV or Feather files.')
+    parser.add_argument('manifest',help='JSON or YAML file listing the requests')
+    parser.add_argument('--output',help='directory of the exported files (default: current directory)')
+    parser.add_argument('--format',choices=list(exportFormats),help='file format (default: parquet)')
+    parser.add_argument('--api-key',dest='apiKey',help='BEA API key (default: BEA_API_KEY environment variable)')
+    parser.add_argument('--base-url',dest='baseUrl',help='URL of the API, e.g. a local stub server (default: BEA_API_URL environment variable, or the BEA API)')
+    parser.add_argument('--cache',help='SQLite file caching raw responses (see ResponseCache)')
+    parser.add_argument('--workers',type=int,help='requests in flight at once (default: 8)')
+    parser.add_argument('--writers',type=int,help='threads writing files (default: 2)')
+    parser.add_argument('--rate-limit',dest='rateLimit',type=int,help='most requests per minute (default: 100)')
+    parser.add_argument('--processes',type=int,help='worker processes parsing responses (default: none, parse in threads)')
+    parser.add_argument('--no-resume',dest='resume',action='store_false',default=None,help='export every request again, even if its file exists')
+    args = parser.parse_args(argv)
+
+    options, specs = loadManifest(args.manifest)
+    options.update({key:value for key,value in vars(args).items() if value is not None and key!='manifest'})
+
+    apiKey = options.get('apiKey',os.environ.get('BEA_API_KEY'))
+    cache = ResponseCache(options['cache']) if options.get('cache') else None
+    workers = int(options.get('workers',8))
+    baseUrl = options.get('baseUrl',os.environ.get('BEA_API_URL'))
+    client = initialize(apiKey,cache=cache,poolSize=workers,rateLimit=options.get('rateLimit',100),baseUrl=baseUrl)
+
+    results = export(client,specs,output=options.get('output','.'),format=options.get('format','parquet'),workers=workers,
+                     writers=int(options.get('writers',2)),resume=options.get('resume',True),processes=options.get('processes'))
+    return 0 if all(error is None for error in results.values()) else 1
+
+
+if __name__=='__main__':
+    sys.exit(main())
@@ -0,0 +1,228 @@
+'''Offline benchmarks for beapy.
+
+Replays synthetic (or recorded) BEA API responses of increasing size through the data methods of beapy.initialize,
+served by the local stub server of stubserver.py so that no request reaches the live API. For every method and size it reports the wall
+time of the call, the data records parsed per second and the peak resident memory of the process that made it.
+
+Usage:
+
+    python benchmark.py
+    python benchmark.py --sizes 1000 100000 --methods getNipa getIta --output long
+    python benchmark.py --fixtures recorded/ --json results.json
+    python benchmark.py --startup
+
+Each case runs in a fresh process, so peak memory is measured for that case alone. Recorded responses are read from
+files named after the method (e.g. recorded/getNipa.json) in the --fixtures directory and are benchmarked in
+addition to the synthetic ones.
+
+With --startup, it instead measures how long `import beapy`, and listing the datasets from a cached catalog, add to
+the start of a fresh Python process, and checks that neither loads requests, numpy or pandas. It exits with status 1
+if the median time exceeds startupTarget or a heavy module is loaded.
+'''
+
+import argparse
+import json
+import math
+import multiprocessing
+import multiprocessing.forkserver
+import os
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from stubserver import StubServer, recordCount, syntheticResponse
+
+
+# Arguments each method is called with. The stub server ignores them, but they are the ones a real request would use.
+
+methodArguments = {
+    'getNipa':{'TableID':'T10101','Frequency':'Q','Year':'X'},
+    'getFixedAssets':{'TableID':'FAAt101','Year':'X'},
+    'getGdpByIndustry':{'TableID':'1','Industry':'ALL','Frequency':'A','Year':'ALL'},
+    'getIta':{'Indicator':'BalGds','AreaOrCountry':'ALL','Frequency':'A','Year':'ALL'},
+    'getIip':{'TypeOfInvestment':'FinAssetsExclFinDeriv','Component':'Pos','Frequency':'A','Year':'ALL'},
+    'getRegionalData':{'KeyCode':'PCPI_CI','GeoFips':'STATE','Year':'ALL'},
+    'getRegionalIncome':{'TableName':'CA1','LineCode':'1','GeoFips':'STATE','Year':'ALL'},
+    'getRegionalProduct':{'Component':'RGDP_SAN','IndustryId':'1','GeoFips':'STATE','Year':'ALL'},
+}
+
+# Dataset requested by each method, which selects the shape of the synthetic records
+methodDatasets = {
+    'getNipa':'NIPA',
+    'getFixedAssets':'FixedAssets',
+    'getGdpByIndustry':'GDPbyIndustry',
+    'getIta':'ITA',
+    'getIip':'IIP',
+    'getRegionalData':'RegionalData',
+    'getRegionalIncome':'RegionalIncome',
+    'getRegionalProduct':'RegionalProduct',
+}
+
+defaultSizes = [1000,10000,100000,1000000]
+
+# Most time, in seconds, that importing beapy or a cached metadata lookup may add to the start of a process, and the
+# modules they must not load
+startupTarget = 0.05
+heavyModules = ['requests','numpy','pandas','aiohttp','pyarrow']
+
+# Number of fresh processes timed for each startup case
+startupRuns = 20
+
+
+# Benchmark cases
+
+def peakRss():
+
+    '''Function returning the peak resident memory of the current process, in megabytes.'''
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform=='darwin':
+        return peak/2**20
+    return peak/2**10
+
+
+def runCase(url,method,output,repeat):
+
+    '''Function run in a fresh process for each case. Calls method against the stub server at url repeat times and
+    returns the best wall time in seconds and the peak resident memory in megabytes.'''
+
+    import beapy
+
+    client = beapy.initialize(apiKey='benchmark',rateLimit=None,validate=False,splitRequests=False,baseUrl=url)
+    # Load the modules beapy imports lazily, so their import time is not counted
+    client.session, beapy.np.ndarray, beapy.pd.DataFrame
+    best = math.inf
+    for i in range(repeat):
+        start = time.perf_counter()
+        result = client.fetch(method,output=output,**methodArguments[method])
+        best = min(best,time.perf_counter()-start)
+        del result
+    return best, peakRss()
+
+
+def runBenchmarks(methods,sizes,output='wide',repeat=1,fixtures=None):
+
+    '''Function running every method at every size and returning a list of result dicts with the method, size,
+    records, wall time (seconds), records/sec and peak RSS (MB) of each case.'''
+
+    # ru_maxrss survives fork and exec, so cases are forked from a server process started before any fixture is
+    # loaded, keeping the peak memory of the parent out of the measurements.
+    if 'forkserver' in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context('forkserver')
+        multiprocessing.forkserver.ensure_running()
+    else:
+        context = multiprocessing.get_context('spawn')
+    server = StubServer()
+    results = []
+    try:
+        for method in methods:
+            cases = [(str(size),None) for size in sizes]
+            if fixtures is not None and os.path.exists(os.path.join(fixtures,method+'.json')):
+                cases.append(('recorded',os.path.join(fixtures,method+'.json')))
+            for label,path in cases:
+                if path is None:
+                    body = syntheticResponse(methodDatasets[method],int(label),methodArguments[method])
+                else:
+                    with open(path,'rb') as f:
+                        body = f.read()
+                records = recordCount(body)
+                name = method+'-'+label
+                server.add(name,body)
+                del body
+                with context.Pool(1,maxtasksperchild=1) as pool:
+                    seconds, rss = pool.apply(runCase,(server.url(name),method,output,repeat))
+                server.add(name,None)
+                result = {'method':method,'size':label,'records':records,'seconds':seconds,
+                          'recordsPerSecond':records/seconds if seconds>0 else math.inf,'peakRssMb':rss}
+                results.append(result)
+                printResult(result)
+    finally:
+        server.close()
+    return results
+
+
+# Startup
+
+startupCases = {
+    'import':'import beapy',
+    'metadata':'import beapy\nbeapy.initialize(catalogPath={path!r}).getDataSetList()',
+}
+
+startupScript = '''import json, sys, time
+start = time.perf_counter()
+{body}
+print(json.dumps({{'seconds':time.perf_counter()-start,'loaded':[name for name in {heavy!r} if name in sys.modules]}}))
+'''
+
+
+def runStartup(runs=startupRuns):
+
+    '''Function timing each startup case in runs fresh processes. Returns a list of result dicts with the case,
+    median time (seconds), heavy modules loaded and whether the case meets startupTarget.'''
+
+    directory = os.path.dirname(os.path.abspath(__file__))
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp,'catalog.json')
+        with open(path,'w') as f:
+            records = [{'DatasetName':'NIPA','DatasetDescription':'Standard NIPA tables'},
+                       {'DatasetName':'Regional','DatasetDescription':'Regional data sets'}]
+            json.dump({'datasets':{'fetched':time.time(),'records':records}},f)
+
+        results = []
+        for case,body in startupCases.items():
+            script = startupScript.format(body=body.format(path=path),heavy=heavyModules)
+            times = []
+            loaded = set()
+            for i in range(runs):
+                output = subprocess.run([sys.executable,'-c',script],cwd=directory,capture_output=True,text=True,check=True).stdout
+                measurement = json.loads(output.strip().splitlines()[-1])
+                times.append(measurement['seconds'])
+                loaded.update(measurement['loaded'])
+            seconds = statistics.median(times)
+            result = {'case':case,'seconds':seconds,'loaded':sorted(loaded),'ok':seconds<=startupTarget and len(loaded)==0}
+            results.append(result)
+            print('{:<20}{:>12.4f}{:>12}  {}'.format(case,seconds,'ok' if result['ok'] else 'FAIL',', '.join(result['loaded'])))
+            sys.stdout.flush()
+    return results
+
+
+def printResult(result):
+
+    '''Function printing one row of the results table.'''
+
+    print('{method:<20}{size:>10}{records:>10}{seconds:>12.4f}{recordsPerSecond:>16,.0f}{peakRssMb:>12.1f}'.format(**result))
+    sys.stdout.flush()
+
+
+def main(argv=None):
+
+    parser = argparse.ArgumentParser(description='Offline benchmarks of the beapy data methods.')
+    parser.add_argument('--methods',nargs='+',default=list(methodArguments),choices=list(methodArguments))
+    parser.add_argument('--sizes',nargs='+',type=int,default=defaultSizes,help='numbers of data records')
+    parser.add_argument('--output',default='wide',choices=['wide','long','sparse'])
+    parser.add_argument('--repeat',type=int,default=None,help='calls per case; the best time is reported (startup: processes per case, median reported)')
+    parser.add_argument('--fixtures',help='directory of recorded responses named <method>.json')
+    parser.add_argument('--json',help='file to which the results are written as JSON')
+    parser.add_argument('--startup',action='store_true',help='measure import and cached metadata startup time instead')
+    args = parser.parse_args(argv)
+
+    if args.startup:
+        print('{:<20}{:>12}{:>12}  {}'.format('case','seconds','target','heavy modules loaded'))
+        results = runStartup(args.repeat or startupRuns)
+    else:
+        print('{:<20}{:>10}{:>10}{:>12}{:>16}{:>12}'.format('method','size','records','seconds','records/sec','peak MB'))
+        results = runBenchmarks(args.methods,args.sizes,args.output,args.repeat or 1,args.fixtures)
+
+    if args.json is not None:
+        with open(args.json,'w') as f:
+            json.dump(results,f,indent=2)
+
+    if args.startup and not all(result['ok'] for result in results):
+        sys.exit(1)
+
+
+if __name__=='__main__':
+    main()
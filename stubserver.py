@@ -0,0 +1,423 @@
+'''Local stand-in for the BEA API, for offline, load and fault-injection testing.
+
+Serves the four request types beapy sends (GETDATASETLIST, GETPARAMETERLIST, GetParameterValues and GetData) from
+recorded responses where there are any and from generated ones otherwise, so that pipelines, benchmarks and CI runs
+need neither the network nor an API key. Faults can be injected at random to exercise the retry, throttling and
+caching paths of the client:
+
+    latency     seconds added to every response, or a (low, high) range to draw them from
+    throttle    share of requests answered with HTTP 429 and a Retry-After header
+    truncate    share of responses cut off halfway, with the connection closed
+    errors      share of requests answered with a BEA error payload
+    maxRecords  most data records in a GetData response; larger requests are answered with the BEA error saying the
+                request exceeds the maximum data size, as the API does
+
+Usage:
+
+    python stubserver.py --port 8080
+    python stubserver.py --port 8080 --fixtures recorded/ --latency 0.05 0.2 --throttle 0.1 --truncate 0.01
+
+and point a client at it:
+
+    beapy.initialize(apiKey='any',baseUrl='http://127.0.0.1:8080/')
+
+Recorded responses are files in the --fixtures directory named after the request: getdatasetlist.json,
+getparameterlist-<dataset>.json, getparametervalues-<dataset>-<parameter>.json and getdata-<dataset>.json, all in
+lower case. Responses can also be registered from Python with add().
+'''
+
+import argparse
+import collections
+import http.server
+import json
+import os
+import random
+import sys
+import threading
+import time
+import urllib.parse
+
+
+# Number of periods in each generated series. The number of series grows with the size of the response.
+periods = 40
+
+# First year of generated series
+firstYear = 1980
+
+# Datasets listed by GETDATASETLIST
+datasets = [
+    ('NIPA','Standard NIPA tables'),
+    ('NIUnderlyingDetail','Standard NI underlying detail tables'),
+    ('FixedAssets','Standard Fixed Assets tables'),
+    ('ITA','International Transactions Accounts'),
+    ('IIP','International Investment Position'),
+    ('GDPbyIndustry','GDP by Industry'),
+    ('RegionalIncome','Detailed regional income and employment data sets'),
+    ('RegionalProduct','Detailed state and metro area product data sets'),
+    ('RegionalData','State and regional data'),
+]
+
+# Parameters listed by GETPARAMETERLIST: (name, required, accepts several values, default)
+parameters = {
+    'nipa':[('TableID',True,False,''),('Frequency',True,True,''),('Year',True,True,''),('ShowMillions',False,False,'N')],
+    'niunderlyingdetail':[('TableID',True,False,''),('Frequency',True,True,''),('Year',True,True,'')],
+    'fixedassets':[('TableID',True,False,''),('Year',True,True,'')],
+    'ita':[('Indicator',False,True,'ALL'),('AreaOrCountry',False,True,'AllCountries'),('Frequency',False,True,'ALL'),('Year',False,True,'ALL')],
+    'iip':[('TypeOfInvestment',False,True,'ALL'),('Component',False,True,'ALL'),('Frequency',False,True,'ALL'),('Year',False,True,'ALL')],
+    'gdpbyindustry':[('TableID',True,True,''),('Industry',True,True,''),('Frequency',True,True,''),('Year',True,True,'')],
+    'regionalincome':[('TableName',True,False,''),('LineCode',True,False,''),('GeoFips',True,True,''),('Year',False,True,'LAST5')],
+    'regionalproduct':[('Component',True,False,''),('IndustryId',True,False,''),('GeoFips',True,True,''),('Year',False,True,'LAST5')],
+    'regionaldata':[('KeyCode',True,False,''),('GeoFips',False,True,'STATE'),('Year',False,True,'LAST5')],
+}
+
+
+# Generated responses
+
+def timePeriod(year,Frequency,index=0):
+
+    '''Function returning the label of a period in the format used by the API: 2015, 2015Q3 or 2015M07.'''
+
+    if Frequency=='Q':
+        return str(year)+'Q'+str(index+1)
+    if Frequency=='M':
+        return str(year)+'M'+str(index+1).zfill(2)
+    return str(year)
+
+
+def dataValue(series,index):
+
+    '''Function returning a formatted data value, with thousands separators as sent by the API.'''
+
+    return '{:,.1f}'.format(1000+37.3*series+index)
+
+
+def requestedPeriods(params):
+
+    '''Function returning the (year, frequency, index within the year, period label) of each period asked for by a
+    GetData request: the
+    requested years, or periods years from firstYear, at each requested frequency. Seasonal variants such as QSA
+    and QNSA give quarters.'''
+
+    years = [year.strip() for year in str(params.get('Year','ALL')).split(',')]
+    if all(year.isdigit() for year in years):
+        years = [int(year) for year in years]
+    else:
+        years = list(range(firstYear,firstYear+periods))
+    frequencies = [f.strip().upper()[:1] for f in str(params.get('Frequency','A')).split(',')]
+    frequencies = list(dict.fromkeys(f for f in frequencies if f in ('A','Q','M'))) or ['A']
+    return [(year,f,index,timePeriod(year,f,index)) for f in frequencies for year in years for index in range({'A':1,'Q':4,'M':12}[f])]
+
+
+def syntheticRecords(dataset,size,params=None):
+
+    '''Function generating data records shaped like those sent by the API for dataset (e.g. NIPA, RegionalIncome),
+    for the periods asked for by the request parameters params, as JSON text. There are about size records when all
+    years are asked for. The value of a series in a period does not depend on the other periods or geographies asked
+    for, so the chunks of a split request add up to the response to the whole request.'''
+
+    params = params or {}
+    dataset = dataset.lower()
+    dates = requestedPeriods(params)
+    geoFips = [code.strip() for code in str(params.get('GeoFips','')).split(',') if code.strip().isdigit()]
+    count = len(geoFips) or max(1,size//len(requestedPeriods(dict(params,Year='ALL'))))
+    table = str(params.get('TableID',params.get('TableName','T10101')))
+
+    records = []
+    for series in range(count):
+        for year, f, index, period in dates:
+            value = dataValue(int(geoFips[series]) if geoFips else series,(year-firstYear)*{'A':1,'Q':4,'M':12}[f]+index)
+            if dataset in ('nipa','niunderlyingdetail','fixedassets'):
+                record = {'TableName':table,'SeriesCode':'S'+str(series),'LineNumber':str(series+1),
+                          'LineDescription':'Line '+str(series+1),'TimePeriod':period,'METRIC_NAME':'Current Dollars',
+                          'CL_UNIT':'Level','UNIT_MULT':'6','DataValue':value,'NoteRef':table}
+            elif dataset=='gdpbyindustry':
+                record = {'TableID':table,'Frequency':f,'Year':str(year),'Quarter':period[4:] or str(year),
+                          'Industry':'I'+str(series),'IndustrYDescription':'Industry '+str(series),'DataValue':value,
+                          'NoteRef':table}
+            elif dataset=='ita':
+                record = {'Indicator':str(params.get('Indicator','BalGds')).split(',')[0],'AreaOrCountry':'Area'+str(series),
+                          'Frequency':f,'Year':str(year),'TimeSeriesId':'TS'+str(series),
+                          'TimeSeriesDescription':'Series '+str(series),'TimePeriod':period,'CL_UNIT':'USD',
+                          'UNIT_MULT':'6','DataValue':value,'NoteRef':''}
+            elif dataset=='iip':
+                record = {'TypeOfInvestment':str(params.get('TypeOfInvestment','FinAssetsExclFinDeriv')).split(',')[0],
+                          'Component':str(params.get('Component','Pos')).split(',')[0],'Frequency':f,'Year':str(year),
+                          'TimePeriod':period,'TimeSeriesId':'TS'+str(series),'TimeSeriesDescription':'Series '+str(series),
+                          'CL_UNIT':'USD','UNIT_MULT':'6','DataValue':value}
+            else:
+                code = geoFips[series] if geoFips else str(series).zfill(5)
+                lineCode = str(params.get('LineCode',params.get('KeyCode','1'))).split(',')[0]
+                record = {'Code':table+'-'+lineCode,'GeoFips':code,'GeoName':'Area '+code,'TimePeriod':period,
+                          'CL_UNIT':'dollars','UNIT_MULT':'0','DataValue':value}
+            records.append(json.dumps(record))
+    return '['+','.join(records)+']'
+
+
+def syntheticResponse(dataset,size,params=None):
+
+    '''Function returning a generated GetData response for dataset with about size data records, encoded as
+    bytes.'''
+
+    data = syntheticRecords(dataset,size,params)
+    notes = '[{"NoteRef":"T10101","NoteText":"Synthetic fixture"},{"NoteRef":"Q","NoteText":"Seasonally adjusted"}]'
+    if dataset.lower()=='iip':
+        body = '{"BEAAPI":{"Request":{},"Data":'+data+'}}'
+    elif dataset.lower().startswith('regional'):
+        body = ('{"BEAAPI":{"Request":{},"Results":{"Statistic":"Synthetic","UnitOfMeasure":"Dollars",'
+                '"PublicTable":"Synthetic fixture","Notes":'+notes+',"Data":'+data+'}}}')
+    else:
+        body = '{"BEAAPI":{"Request":{},"Results":{"Notes":'+notes+',"Data":'+data+'}}}'
+    return body.encode()
+
+
+def metadataResponse(method,params):
+
+    '''Function returning a generated response to a GETDATASETLIST, GETPARAMETERLIST or GetParameterValues request,
+    as a dict. Parameter values are generated for Year only; other parameters get an empty list, which the catalog
+    of beapy takes as unknown rather than as having no valid values.'''
+
+    dataset = str(params.get('datasetname','')).lower()
+    if method=='GETDATASETLIST':
+        results = {'Dataset':[{'DatasetName':name,'DatasetDescription':description} for name,description in datasets]}
+    elif method=='GETPARAMETERLIST':
+        results = {'Parameter':[{'ParameterName':name,'ParameterDataType':'string','ParameterDescription':name,
+                                 'ParameterIsRequiredFlag':'1' if required else '0',
+                                 'MultipleAcceptedFlag':'1' if multiple else '0','ParameterDefaultValue':default}
+                                for name,required,multiple,default in parameters.get(dataset,[])]}
+    elif str(params.get('ParameterName','')).lower()=='year':
+        results = {'ParamValue':[{'Key':str(year),'Desc':str(year)} for year in range(firstYear,firstYear+periods)]}
+    else:
+        results = {'ParamValue':[]}
+    return {'BEAAPI':{'Request':{'RequestParam':[{'ParameterName':key.upper(),'ParameterValue':value} for key,value in params.items()]},'Results':results}}
+
+
+def errorResponse(code,description):
+
+    '''Function returning a BEA error payload as bytes.'''
+
+    return json.dumps({'BEAAPI':{'Results':{'Error':{'APIErrorCode':str(code),'APIErrorDescription':description}}}}).encode()
+
+
+def recordCount(body):
+
+    '''Function returning the number of data records in an API response.'''
+
+    rJson = json.loads(body)['BEAAPI']
+    if 'Results' in rJson:
+        rJson = rJson['Results']
+    return len(rJson.get('Data',[]))
+
+
+def requestKey(params):
+
+    '''Function returning a key for a set of request parameters that ignores the case and order of names and values,
+    and UserID and ResultFormat.'''
+
+    return tuple(sorted((str(key).lower(),str(value).upper()) for key,value in params.items() if str(key).lower() not in ('userid','resultformat')))
+
+
+# Server
+
+class StubServer:
+
+    '''Local HTTP server standing in for the BEA API, started on construction in a background thread. url() is the
+    baseUrl to give beapy.initialize.
+
+        fixtures    optional directory of recorded responses (see the module docstring)
+        size        approximate number of data records of generated GetData responses
+        latency     seconds added to each response, or a (low, high) range to draw them from
+        throttle    share of requests answered with HTTP 429 (Too Many Requests) and a Retry-After of retryAfter
+                    seconds
+        truncate    share of responses of which only the first half is sent before the connection is closed
+        errors      share of requests answered with a BEA error payload (HTTP 200, as the API does)
+        maxRecords  most data records in a GetData response, or None for no limit. Larger responses are replaced
+                    by the BEA error saying the request exceeds the maximum data size.
+        seed        seed of the random draws, for repeatable runs
+        host, port  address to listen on. port 0 picks a free port.
+
+    The fault settings are attributes and can be changed while the server runs. counts holds the number of requests
+    by method and of each injected fault.
+
+    Responses registered with add() take precedence over recorded and generated ones. A response added under a name
+    is served at url(name) whatever the request; one added under a dict of request parameters is served for requests
+    with those parameters.'''
+
+    def __init__(self,fixtures=None,size=1000,latency=0,throttle=0,truncate=0,errors=0,retryAfter=1,seed=None,host='127.0.0.1',port=0,maxRecords=None):
+
+        self.fixtures = fixtures
+        self.size = size
+        self.latency = latency
+        self.throttle = throttle
+        self.truncate = truncate
+        self.errors = errors
+        self.retryAfter = retryAfter
+        self.maxRecords = maxRecords
+        self.responses = {}
+        self.counts = collections.Counter()
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+        server = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                url = urllib.parse.urlparse(self.path)
+                params = dict(urllib.parse.parse_qsl(url.query))
+                status, headers, body, cut = server.respond(url.path.strip('/'),params)
+                self.send_response(status)
+                self.send_header('Content-Type','application/json')
+                self.send_header('Content-Length',str(len(body)))
+                for key,value in headers.items():
+                    self.send_header(key,value)
+                self.end_headers()
+                if cut:
+                    self.wfile.write(body[:len(body)//2])
+                    self.close_connection = True
+                else:
+                    self.wfile.write(body)
+
+            def log_message(self,*args):
+                pass
+
+        self.httpd = http.server.ThreadingHTTPServer((host,port),Handler)
+        self.httpd.daemon_threads = True
+        self.thread = threading.Thread(target=self.httpd.serve_forever,daemon=True)
+        self.thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self,*exc):
+        self.close()
+
+    def add(self,name,body):
+
+        '''Registers body (bytes, or a dict to be encoded as JSON) as the response for a name or a dict of request
+        parameters. A body of None removes the response.'''
+
+        key = requestKey(name) if isinstance(name,dict) else name
+        if isinstance(body,dict):
+            body = json.dumps(body).encode()
+        if body is None:
+            self.responses.pop(key,None)
+        else:
+            self.responses[key] = body
+
+    def url(self,name=None):
+
+        '''Returns the URL of the server, or the URL serving the response added under name.'''
+
+        host, port = self.httpd.server_address[:2]
+        return 'http://'+host+':'+str(port)+'/'+(name+'/' if name else '')
+
+    def _draw(self,share):
+
+        with self._lock:
+            return share>0 and self._random.random()<share
+
+    def respond(self,name,params):
+
+        '''Returns the (HTTP status, extra headers, body, True if the body is to be cut off) answering a request for
+        path name with the query parameters params, injecting faults as configured.'''
+
+        method = str(params.get('method','')).upper()
+        self._count(method or name or 'unknown')
+
+        latency = self.latency
+        if isinstance(latency,(list,tuple)):
+            with self._lock:
+                latency = self._random.uniform(*latency)
+        if latency:
+            time.sleep(latency)
+
+        if self._draw(self.throttle):
+            self._count('throttled')
+            return 429, {'Retry-After':str(self.retryAfter)}, errorResponse(429,'Too many requests. Retry after '+str(self.retryAfter)+' seconds.'), False
+        if self._draw(self.errors):
+            self._count('errors')
+            return 200, {}, errorResponse(101,'Injected error.'), False
+
+        body = self.responses.get(name) if name else None
+        if body is None:
+            body = self.responses.get(requestKey(params))
+        if body is None:
+            body = self._recorded(method,params)
+        if body is None and method=='GETDATA':
+            body = syntheticResponse(str(params.get('datasetname','NIPA')),self.size,params)
+        elif body is None and method in ('GETDATASETLIST','GETPARAMETERLIST','GETPARAMETERVALUES'):
+            body = json.dumps(metadataResponse(method,params)).encode()
+        if body is None:
+            return 404, {}, errorResponse(404,'Unknown request.'), False
+        if method=='GETDATA' and self.maxRecords is not None and recordCount(body)>self.maxRecords:
+            self._count('tooLarge')
+            return 200, {}, errorResponse(101,'The request exceeds the maximum data size. Request fewer years or geographies.'), False
+
+        cut = self._draw(self.truncate)
+        if cut:
+            self._count('truncated')
+        return 200, {}, body, cut
+
+    def _count(self,key):
+
+        with self._lock:
+            self.counts[key] += 1
+
+    def _recorded(self,method,params):
+
+        '''Returns the recorded response to a request from the fixtures directory, or None if there is none.'''
+
+        if self.fixtures is None:
+            return None
+        parts = [method]
+        if method!='GETDATASETLIST':
+            parts.append(params.get('datasetname',''))
+        if method=='GETPARAMETERVALUES':
+            parts.append(params.get('ParameterName',''))
+        path = os.path.join(self.fixtures,'-'.join(str(part) for part in parts).lower()+'.json')
+        if not os.path.isfile(path):
+            return None
+        with open(path,'rb') as f:
+            return f.read()
+
+    def close(self):
+
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def main(argv=None):
+
+    '''Entry point of python stubserver.py: serves until interrupted.'''
+
+    parser = argparse.ArgumentParser(description='Serve recorded or generated BEA API responses locally.')
+    parser.add_argument('--host',default='127.0.0.1',help='address to listen on (default: 127.0.0.1)')
+    parser.add_argument('--port',type=int,default=8080,help='port to listen on (default: 8080)')
+    parser.add_argument('--fixtures',help='directory of recorded responses')
+    parser.add_argument('--size',type=int,default=1000,help='data records of generated GetData responses (default: 1000)')
+    parser.add_argument('--latency',type=float,nargs='+',default=[0],help='seconds added to each response, or a low and high bound')
+    parser.add_argument('--throttle',type=float,default=0,help='share of requests answered with HTTP 429')
+    parser.add_argument('--retry-after',dest='retryAfter',type=int,default=1,help='Retry-After of throttled responses, in seconds')
+    parser.add_argument('--truncate',type=float,default=0,help='share of responses cut off halfway')
+    parser.add_argument('--errors',type=float,default=0,help='share of requests answered with a BEA error')
+    parser.add_argument('--max-records',dest='maxRecords',type=int,help='most data records in a GetData response (default: no limit)')
+    parser.add_argument('--seed',type=int,help='seed of the random fault draws')
+    args = parser.parse_args(argv)
+
+    latency = args.latency[0] if len(args.latency)==1 else tuple(args.latency[:2])
+    server = StubServer(args.fixtures,args.size,latency,args.throttle,args.truncate,args.errors,args.retryAfter,args.seed,args.host,args.port,args.maxRecords)
+    print('Serving the BEA API stub at '+server.url())
+    try:
+        server.thread.join()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
+    print(dict(server.counts))
+    return 0
+
+
+if __name__=='__main__':
+    sys.exit(main())
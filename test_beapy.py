@@ -0,0 +1,335 @@
+'''Tests of the request, cache, retry and splitting paths of beapy, run against the local BEA API stub of
+stubserver.py. Run with python -m pytest.'''
+
+import asyncio
+import io
+import time
+
+import pandas as pd
+import pytest
+
+import beapy
+import stubserver
+
+
+def client(server,**options):
+
+    '''Function returning a client of the stub server that raises errors, with no rate limit, retry waits or
+    validation unless given in options.'''
+
+    options = dict({'rateLimit':None,'backoff':0,'validate':False,'raiseErrors':True},**options)
+    return beapy.initialize('test',baseUrl=server.url(),**options)
+
+
+def assertSameResult(a,b):
+
+    assert a.keys()==b.keys()
+    for key in a:
+        if isinstance(a[key],pd.DataFrame):
+            pd.testing.assert_frame_equal(a[key],b[key])
+        else:
+            assert a[key]==b[key]
+
+
+@pytest.fixture
+def server():
+
+    with stubserver.StubServer(size=200,seed=1) as server:
+        yield server
+
+
+# Response cache
+
+def testCacheHit(server,tmp_path):
+
+    cache = beapy.ResponseCache(str(tmp_path/'cache.db'))
+    first = client(server,cache=cache).getNipa('T10101','Q')
+    second = client(server,cache=cache).getNipa('T10101','Q')
+    assert server.counts['GETDATA']==1
+    assertSameResult(first,second)
+
+
+def testCacheTtl(server,tmp_path):
+
+    cache = beapy.ResponseCache(str(tmp_path/'cache.db'),ttl={'NIPA':0.05})
+    client(server,cache=cache).getNipa('T10101','Q')
+    client(server,cache=cache).getNipa('T10101','Q')
+    assert server.counts['GETDATA']==1
+    time.sleep(0.1)
+    client(server,cache=cache).getNipa('T10101','Q')
+    assert server.counts['GETDATA']==2
+
+
+def testCacheInvalidate(server,tmp_path):
+
+    cache = beapy.ResponseCache(str(tmp_path/'cache.db'))
+    client(server,cache=cache).getNipa('T10101','Q')
+    client(server,cache=cache).getFixedAssets('FAAt101')
+    cache.invalidate('NIPA')
+    client(server,cache=cache).getNipa('T10101','Q')
+    client(server,cache=cache).getFixedAssets('FAAt101')
+    assert server.counts['GETDATA']==3
+
+
+def testErrorsAreNotCached(server,tmp_path):
+
+    cache = beapy.ResponseCache(str(tmp_path/'cache.db'))
+    server.errors = 1
+    with pytest.raises(beapy.BeaError):
+        client(server,cache=cache).getNipa('T10101','Q')
+    server.errors = 0
+    assert client(server,cache=cache).getNipa('T10101','Q') is not None
+    assert server.counts['GETDATA']==2
+
+
+# Retries
+
+def testThrottledRequestIsRetried(server):
+
+    expected = client(server).getNipa('T10101','Q')
+    server.throttle = 0.5
+    server.retryAfter = 0
+    for i in range(5):
+        assertSameResult(client(server).getNipa('T10101','Q'),expected)
+    assert server.counts['throttled']>0
+
+
+def testThrottlingIsNotSplit(server):
+
+    server.throttle = 1
+    server.retryAfter = 0
+    with pytest.raises(beapy.BeaError,match='429'):
+        client(server,retries=2).getNipa('T10101','Q',Year=list(range(1990,2010)))
+    assert server.counts['GETDATA']==3
+
+
+def testCutOffResponseIsRetried(server):
+
+    server.truncate = 0.5
+    for streaming in (False,True):
+        for i in range(5):
+            assert client(server,streaming=streaming).getNipa('T10101','Q') is not None
+    assert server.counts['truncated']>0
+
+    server.truncate = 1
+    with pytest.raises(beapy.BeaError,match='cut off'):
+        client(server,retries=1).getNipa('T10101','Q')
+
+
+def testInvalidJsonRaisesBeaError(server):
+
+    bea = client(server)
+    server.add(bea._getNipaRequest('T10101','Q')[0],b'{"BEAAPI": {"Results": ')
+    with pytest.raises(beapy.BeaError,match='not valid JSON'):
+        bea.getNipa('T10101','Q')
+
+
+def testInvalidRequestRaisesWithRaiseErrors(server,capsys):
+
+    with pytest.raises(beapy.ValidationError):
+        client(server).getIta('ALL','ALL')
+    assert client(server,raiseErrors=False).getIta('ALL','ALL') is None
+    assert 'ALL' in capsys.readouterr().out
+    assert server.counts['GETDATA']==0
+
+
+# Split requests
+
+def testSizeErrorSplitMatchesSingleRequest(server):
+
+    years = list(range(1990,2010))
+    expected = client(server).getNipa('T10101','Q',Year=years)
+    server.maxRecords = 30
+    assertSameResult(client(server).getNipa('T10101','Q',Year=years),expected)
+    assert server.counts['tooLarge']>0
+
+
+def testPlannedSplitMatchesSingleRequest(server):
+
+    expected = client(server,splitRequests=False).getRegionalIncome('CAINC1',1,'COUNTY')
+    bea = client(server)
+    assert len(bea._planRequests(bea._getRegionalIncomeRequest('CAINC1',1,'COUNTY')[0]))>1
+    assertSameResult(bea.getRegionalIncome('CAINC1',1,'COUNTY'),expected)
+
+
+def testFailedChunkRaises(server):
+
+    bea = client(server)
+    chunks = bea._planRequests(bea._getRegionalIncomeRequest('CAINC1',1,'COUNTY')[0])
+    server.add(chunks[1],stubserver.errorResponse(101,'Injected error.'))
+    with pytest.raises(beapy.BeaError,match='chunk Year=.*Injected error'):
+        bea.getRegionalIncome('CAINC1',1,'COUNTY')
+
+
+def testFailedChunkPrintsWithoutRaiseErrors(server,capsys):
+
+    bea = client(server,raiseErrors=False)
+    chunks = bea._planRequests(bea._getRegionalIncomeRequest('CAINC1',1,'COUNTY')[0])
+    server.add(chunks[0],stubserver.errorResponse(101,'Injected error.'))
+    assert bea.getRegionalIncome('CAINC1',1,'COUNTY') is None
+    assert 'Injected error' in capsys.readouterr().out
+    with pytest.raises(beapy.BeaError):
+        bea.fetch('getRegionalIncome','CAINC1',1,'COUNTY')
+
+
+# Streaming
+
+@pytest.mark.parametrize('method,args',[
+    ('getNipa',('T10101','Q')),
+    ('getIta',('BalGds','ALL','Q')),
+    ('getIip',('FinAssetsExclFinDeriv','Pos','A')),
+    ('getRegionalIncome',('CAINC1',1,'STATE')),
+])
+def testStreamingMatchesNonStreaming(server,method,args):
+
+    assertSameResult(getattr(client(server,streaming=True),method)(*args),getattr(client(server),method)(*args))
+
+
+@pytest.mark.parametrize('streaming',[False,True])
+def testAsyncMatchesSync(server,streaming):
+
+    async def fetch():
+        async with beapy.AsyncInitialize('test',baseUrl=server.url(),rateLimit=None,validate=False,streaming=streaming,raiseErrors=True) as bea:
+            return await bea.getNipa('T10101','Q'), await bea.getRegionalPanel('CA1',[1,2],Year=2015)
+
+    result, panel = asyncio.run(fetch())
+    assertSameResult(result,client(server).getNipa('T10101','Q'))
+    assertSameResult(panel,client(server).getRegionalPanel('CA1',[1,2],Year=2015))
+
+
+# Frequencies
+
+def testSeasonalFrequenciesAreValidated(server):
+
+    server.add({'method':'GetParameterValues','datasetname':'IIP','ParameterName':'Frequency'},
+               {'BEAAPI':{'Results':{'ParamValue':[{'Key':'A'},{'Key':'QSA'},{'Key':'QNSA'}]}}})
+    bea = client(server,validate=True)
+    result = bea.getIip('FinAssetsExclFinDeriv','Pos','QNSA',2015)
+    assert len(result['date'])==4
+    with pytest.raises(beapy.ValidationError) as error:
+        bea.getIip('FinAssetsExclFinDeriv','Pos','M',2015)
+    assert error.value.parameter=='Frequency'
+
+
+def testQuarterlyItaDates(server):
+
+    frame = client(server).getIta('BalGds','ALL','Q',2015)['data']
+    assert list(frame.index)==list(pd.to_datetime(['2015-01-01','2015-04-01','2015-07-01','2015-10-01']))
+
+
+def testFrequencyList(server):
+
+    bea = client(server)
+    assertSameResult(bea.getGdpByIndustry('1','ALL',['A']),bea.getGdpByIndustry('1','ALL','A'))
+
+
+def testItaSeriesTable(server):
+
+    result = client(server).getIta('BalGds','ALL','A',seriesKey='code')
+    assert list(result['series'].index)==list(result['data'].columns)
+    assert {'units','multiplier'}<=set(result['series'].columns)
+    assertSameResult(client(server,streaming=True).getIta('BalGds','ALL','A',seriesKey='code'),result)
+
+
+def testMixedFrequencyDiff(server):
+
+    bea = client(server)
+    revisions = beapy.diff(bea.getNipa('T10101','A,Q',2015),bea.getNipa('T10101','A,Q',2015))
+    assert set(revisions)=={'A','Q'}
+    assert all(len(frame)==0 for frame in revisions.values())
+
+
+def testMixedFrequencyInWorkerProcesses(server):
+
+    specs = {'wide':{'method':'getNipa','TableID':'T10101','Frequency':'A,Q','Year':'2015,2016'},
+             'long':{'method':'getNipa','TableID':'T10101','Frequency':'A,Q','Year':'2015,2016','output':'long'}}
+    bea = client(server)
+    threaded = bea.getMany(specs)
+    processed = bea.getMany(specs,processes=2)
+    for key in specs:
+        assert set(processed[key]['data'])=={'A','Q'}
+        for f in ('A','Q'):
+            pd.testing.assert_frame_equal(processed[key]['data'][f],threaded[key]['data'][f])
+    assert isinstance(processed['wide']['data']['Q'].index,pd.PeriodIndex)
+
+
+def testMixedFrequencyGdpByIndustryIsRejected(server):
+
+    with pytest.raises(beapy.ValidationError):
+        client(server).getGdpByIndustry('1','ALL','A,Q')
+    assert server.counts['GETDATA']==0
+
+
+def testMixedFrequencyExportIsRejected(server,tmp_path):
+
+    with pytest.raises(beapy.ValidationError):
+        beapy.export(client(server),[{'method':'getNipa','TableID':'T10101','Frequency':'A,Q'}],output=str(tmp_path),format='csv',stream=io.StringIO())
+    assert server.counts['GETDATA']==0
+
+
+# Export
+
+class TimedStream(io.StringIO):
+
+    '''Stream recording the time at which each line is written.'''
+
+    def __init__(self):
+
+        io.StringIO.__init__(self)
+        self.times = []
+
+    def write(self,text):
+
+        self.times.append(time.perf_counter())
+        return io.StringIO.write(self,text)
+
+
+def testExportReportsProgressAsFilesAreWritten(server,tmp_path):
+
+    server.latency = 0.2
+    stream = TimedStream()
+    specs = [{'method':'getNipa','TableID':'T'+str(i),'Frequency':'Q'} for i in range(3)]
+    results = beapy.export(client(server),specs,output=str(tmp_path),format='csv',workers=1,stream=stream)
+    assert all(error is None for error in results.values())
+    progress = [t for t,line in zip(stream.times,stream.getvalue().splitlines()) if line.startswith('[')]
+    assert len(progress)==3
+    assert progress[-1]-progress[0]>=0.3
+
+
+# Data store
+
+def testStoreRejectsOtherLayouts(server,tmp_path):
+
+    store = beapy.DataStore(client(server),str(tmp_path))
+    for option in [{'output':'long'},{'output':'sparse'},{'codes':True},{'seriesKey':'code'}]:
+        with pytest.raises(beapy.ValidationError):
+            store.refresh('getNipa',TableID='T10101',Frequency='Q',**option)
+    assert server.counts['GETDATA']==0
+    store.refresh('getNipa',TableID='T10101',Frequency='Q')
+    assertSameResult(store.load('getNipa',TableID='T10101',Frequency='Q'),client(server).getNipa('T10101','Q'))
+
+
+# Catalog
+
+def testCatalogIsKeptOnDisk(server,tmp_path,monkeypatch):
+
+    monkeypatch.setenv('HOME',str(tmp_path))
+    assert beapy.initialize('test').catalog.path==str(tmp_path/'.beapy'/'catalog.json')
+    assert beapy.initialize('test',catalogPath=False).catalog.path is None
+    assert client(server).catalog.path is None
+
+    path = str(tmp_path/'catalog.json')
+    client(server,catalogPath=path).catalog.datasetRecords()
+    client(server,catalogPath=path).catalog.datasetRecords()
+    assert server.counts['GETDATASETLIST']==1
+
+
+# Rate limit
+
+def testStrictestRateLimitApplies():
+
+    loose = beapy.initialize('rate-limit-test',rateLimit=100)
+    strict = beapy.initialize('rate-limit-test',rateLimit=10)
+    beapy.initialize('rate-limit-test',rateLimit=50)
+    assert loose.rateLimiter is strict.rateLimiter
+    assert loose.rateLimiter.maxRequests==10